@@ -1,30 +1,65 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Q
 from django.utils.html import format_html
 from django.utils import timezone
 from .models import Room, Message
+from .moderation import moderate
+from .paginator import EstimatedCountPaginator
+from .search import content_match
+from . import presence
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
-    list_display = ('name', 'created_at', 'message_count', 'active_users_24h', 'flagged_messages')
+    list_display = ('name', 'created_at', 'message_count', 'online_now', 'active_users_24h', 'flagged_messages')
     search_fields = ('name',)
-    readonly_fields = ('created_at', 'room_statistics')
+    # The slug follows the name (see Room.save)
+    readonly_fields = ('slug', 'created_at', 'room_statistics')
+    
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        # Per-row figures for the whole page at once: one aggregate query and
+        # one presence round trip rather than several of each per row
+        rooms = list(changelist.result_list)
+        last_24h = timezone.now() - timedelta(hours=24)
+        rows = Room.objects.filter(id__in=[room.id for room in rooms]).values('id').annotate(
+            total_messages=Count('messages'),
+            active_users_24h=Count(
+                'messages__user', distinct=True, filter=Q(messages__created_at__gte=last_24h)
+            ),
+            flagged_count=Count('messages', filter=Q(messages__is_flagged=True)),
+        )
+        figures = {row['id']: row for row in rows}
+        online = presence.online_users_many(room.slug for room in rooms)
+        for room in rooms:
+            room.figures = figures[room.id]
+            room.online = online[room.slug]
+        return changelist
     
     def message_count(self, obj):
-        return obj.messages.count()
+        return obj.figures['total_messages']
     message_count.short_description = 'Total Messages'
     
+    def online_now(self, obj):
+        return len(obj.online)
+    online_now.short_description = 'Online Now'
+    
     def active_users_24h(self, obj):
-        stats = obj.get_statistics()
         return format_html('<span title="Active users in last 24 hours">{} users</span>', 
-                         stats['active_users_24h'])
+                         obj.figures['active_users_24h'])
     active_users_24h.short_description = 'Active Users (24h)'
     
     def flagged_messages(self, obj):
-        stats = obj.get_statistics()
-        if stats['flagged_count'] > 0:
+        flagged_count = obj.figures['flagged_count']
+        if flagged_count > 0:
             return format_html(
                 '<span style="color: #d9534f;" title="Messages flagged for review">{}</span>',
-                stats['flagged_count']
+                flagged_count
             )
         return '0'
     flagged_messages.short_description = 'Flagged'
@@ -48,6 +83,7 @@ class RoomAdmin(admin.ModelAdmin):
             # User Activity Panel
             '<div class="stat-box" style="background: #f8f9fa; padding: 15px; border-radius: 5px;">' +
             '<h4>User Activity</h4>' +
+            '<p>Online now: <strong>{}</strong></p>' +
             '<p>Active users (24h): <strong>{}</strong></p>' +
             '<p>Active users (7d): <strong>{}</strong></p>' +
             '</div>' +
@@ -74,6 +110,7 @@ class RoomAdmin(admin.ModelAdmin):
             stats['total_messages'],
             
             # User Activity values
+            stats['online_now'],
             stats['active_users_24h'],
             stats['active_users_7d'],
             
@@ -88,9 +125,41 @@ class RoomAdmin(admin.ModelAdmin):
         )
     room_statistics.short_description = 'Room Statistics'
 
+STATS_VERSION_KEY = 'admin:message_stats:version'
+
+def invalidate_dashboard_stats():
+    """Drop every cached set of dashboard stats by moving to a new key version"""
+    try:
+        cache.incr(STATS_VERSION_KEY)
+    except ValueError:
+        cache.set(STATS_VERSION_KEY, 1, None)
+
+def message_dashboard_stats(queryset, filters):
+    """
+    Flagged, pending and today's counts for the moderation dashboard in one
+    query, cached for ADMIN_STATS_CACHE_TTL seconds per set of filters
+    """
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    version = cache.get(STATS_VERSION_KEY, 0)
+    key = f'admin:message_stats:{version}:' + hashlib.md5(
+        f'{filters}|{today.date()}'.encode()
+    ).hexdigest()
+    stats = cache.get(key)
+    if stats is None:
+        stats = queryset.order_by().aggregate(
+            flagged_count=Count('id', filter=Q(is_flagged=True)),
+            pending_count=Count('id', filter=Q(moderation_status='pending')),
+            today_count=Count('id', filter=Q(created_at__gte=today)),
+        )
+        cache.set(key, stats, settings.ADMIN_STATS_CACHE_TTL)
+    return stats
+
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     change_list_template = 'admin/message_changelist.html'
+    paginator = EstimatedCountPaginator
+    # Skip the extra unfiltered COUNT(*) behind "N results (M total)"
+    show_full_result_count = False
     
     def changelist_view(self, request, extra_context=None):
         # Get base queryset
@@ -101,13 +170,11 @@ class MessageAdmin(admin.ModelAdmin):
         except (AttributeError, KeyError):
             return response
             
-        # Add statistics to the context
-        response.context_data['flagged_count'] = qs.filter(is_flagged=True).count()
-        response.context_data['pending_count'] = qs.filter(moderation_status='pending').count()
-        
-        # Get today's messages
-        today = timezone.now().date()
-        response.context_data['today_count'] = qs.filter(created_at__date=today).count()
+        # Add statistics to the context; paging and ordering don't change them
+        filters = sorted(
+            (k, v) for k, v in request.GET.lists() if k not in ('p', 'o')
+        )
+        response.context_data.update(message_dashboard_stats(qs, filters))
         
         return response
     list_display = ('truncated_content', 'user', 'room', 'created_at', 'moderation_status_badge', 'moderated_at')
@@ -117,6 +184,18 @@ class MessageAdmin(admin.ModelAdmin):
     actions = ['approve_messages', 'flag_messages', 'reject_messages']
     ordering = ('-created_at',)
     
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        # Resolve users and rooms up front so every branch filters the message
+        # table itself; content goes through the full-text/trigram indexes
+        users = User.objects.filter(username__icontains=search_term).values('id')
+        rooms = Room.objects.filter(name__icontains=search_term).values('id')
+        queryset = queryset.filter(
+            Q(user__in=users) | Q(room__in=rooms) | content_match(search_term, using=queryset.db)
+        )
+        return queryset, False
+
     def truncated_content(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     truncated_content.short_description = 'Content'
@@ -156,26 +235,21 @@ class MessageAdmin(admin.ModelAdmin):
         )
     sentiment_analysis.short_description = 'Sentiment Analysis'
     
+    def bulk_moderate(self, request, queryset, status, is_flagged):
+        # One UPDATE and one batched notification per room, however many rows
+        by_room = moderate(queryset, status, is_flagged)
+        invalidate_dashboard_stats()
+        count = sum(len(ids) for ids in by_room.values())
+        self.message_user(request, f'{count} message(s) marked {status} in {len(by_room)} room(s).')
+
     def approve_messages(self, request, queryset):
-        queryset.update(
-            moderation_status='approved',
-            is_flagged=False,
-            moderated_at=timezone.now()
-        )
+        self.bulk_moderate(request, queryset, 'approved', is_flagged=False)
     approve_messages.short_description = 'Approve selected messages'
     
     def flag_messages(self, request, queryset):
-        queryset.update(
-            moderation_status='flagged',
-            is_flagged=True,
-            moderated_at=timezone.now()
-        )
+        self.bulk_moderate(request, queryset, 'flagged', is_flagged=True)
     flag_messages.short_description = 'Flag selected messages'
     
     def reject_messages(self, request, queryset):
-        queryset.update(
-            moderation_status='rejected',
-            is_flagged=True,
-            moderated_at=timezone.now()
-        )
+        self.bulk_moderate(request, queryset, 'rejected', is_flagged=True)
     reject_messages.short_description = 'Reject selected messages'
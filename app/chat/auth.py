@@ -0,0 +1,41 @@
+"""
+Authentication backend that caches user lookups.
+
+Every page view and WebSocket connect resolves request.user from the session
+(django.contrib.auth.get_user and channels' AuthMiddleware both go through
+the backend's get_user), which is a primary key lookup on auth_user each
+time. CachedModelBackend serves it from the cache for USER_CACHE_TTL seconds
+instead; saving or deleting a user drops its entry, so password changes and
+deactivation take effect immediately.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+User = get_user_model()
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.USER_CACHE_TTL)
+        # Same check ModelBackend.get_user applies on the way out of the DB
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, **kwargs):
+    cache.delete(user_cache_key(instance.pk))
@@ -1,21 +1,33 @@
 import json
+import logging
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from . import metrics, presence
+from .profiling import profile_queries
 from .models import Room, Message
+from .ratelimit import connection_bucket, get_rate_limiter
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         
         # Check if room exists
-        if not await self.get_room():
+        room = await self.get_room()
+        if not room:
+            metrics.WS_CONNECTS.labels('rejected').inc()
             await self.close()
             return
+        # Groups and presence are keyed on the slug, however the room was named
+        self.room_name = room.slug
             
         self.room_group_name = f'chat_{self.room_name}'
+        self.rate_limit = connection_bucket()
 
         # Join room group
         await self.channel_layer.group_add(
@@ -23,41 +35,106 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
+        # Only logged-in users show up as present
+        user = self.scope.get('user')
+        self.presence_name = user.username if user is not None and user.is_authenticated else None
+        # The per-user limit must not trust the username in the payload, or
+        # anyone could drain someone else's bucket. Anonymous sockets are
+        # limited by client address (or, failing that, by socket).
+        if self.presence_name:
+            self.rate_limit_key = self.presence_name
+        elif self.scope.get('client'):
+            self.rate_limit_key = f"anon:{self.scope['client'][0]}"
+        else:
+            self.rate_limit_key = f'anon:{self.channel_name}'
+        if self.presence_name:
+            await presence.join(self.room_name, self.presence_name, self.channel_name)
+            self.last_heartbeat = time.monotonic()
+
         await self.accept()
+        metrics.WS_CONNECTS.labels('accepted').inc()
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return
+        metrics.WS_DISCONNECTS.inc()
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
+        if self.presence_name:
+            await presence.leave(self.room_name, self.presence_name, self.channel_name)
+
     async def receive(self, text_data):
+        received_at = time.perf_counter()
         text_data_json = json.loads(text_data)
+        if text_data_json.get('type') == 'heartbeat':
+            await self.heartbeat()
+            return
+
+        # Per-connection bucket first: it's free and stops a single socket
+        # from flooding before we touch the shared limiter
+        if self.rate_limit is not None:
+            retry_after = self.rate_limit.consume()
+            if retry_after:
+                await self.throttle('connection', retry_after)
+                return
+
         message = text_data_json['message']
         username = text_data_json['username']
 
+        scope, retry_after = await get_rate_limiter().check(
+            user=self.rate_limit_key, room=self.room_name,
+        )
+        if scope:
+            await self.throttle(scope, retry_after)
+            return
+
         # Save message and get the message object
-        message_obj = await self.save_message(username, message)
+        with metrics.SAVE_MESSAGE.time():
+            message_obj = await self.save_message(username, message)
         if not message_obj:
             return
 
         # Send initial message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'username': username,
-                'message_id': message_obj.id,
-                'timestamp': message_obj.created_at.isoformat(),
-            }
-        )
+        with metrics.GROUP_SEND.labels('chat_message').time():
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {
+                    'type': 'chat_message',
+                    'message': message,
+                    'username': username,
+                    'message_id': message_obj.id,
+                    'timestamp': message_obj.created_at.isoformat(),
+                }
+            )
+        metrics.RECEIVE_TO_BROADCAST.observe(time.perf_counter() - received_at)
 
         # Start moderation in background
         from .tasks import moderate_message_content
         moderate_message_content.delay(message_obj.id)
 
+    async def heartbeat(self):
+        # Clients may ping more often than needed; only refresh Redis when
+        # at least half the heartbeat interval has passed
+        now = time.monotonic()
+        if not self.presence_name or now - self.last_heartbeat < settings.PRESENCE_HEARTBEAT_INTERVAL / 2:
+            return
+        self.last_heartbeat = now
+        await presence.heartbeat(self.room_name, self.presence_name, self.channel_name)
+
+    async def throttle(self, scope, retry_after):
+        # Tell the sender its message was dropped instead of processing it
+        metrics.WS_THROTTLED.labels(scope).inc()
+        await self.send(text_data=json.dumps({
+            'type': 'throttle',
+            'scope': scope,
+            'retry_after': round(retry_after, 3),
+        }))
+
     async def chat_message(self, event):
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
@@ -69,7 +146,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
 
     async def moderation_update(self, event):
-        print(f"Moderation update received: {event}")
+        logger.debug('Moderation update received: %s', event)
         # Send moderation update to WebSocket
         await self.send(text_data=json.dumps({
             'type': 'moderation',
@@ -78,22 +155,35 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'notes': event['notes']
         }))
 
+    async def moderation_batch(self, event):
+        # Bulk admin actions: one event for many messages in this room
+        await self.send(text_data=json.dumps({
+            'type': 'moderation_batch',
+            'status': event['status'],
+            'message_ids': event['message_ids'],
+        }))
+
+    async def presence_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'online': event['online'],
+            'users': event['users'],
+        }))
+
     @database_sync_to_async
+    @metrics.count_queries('ws_connect')
+    @profile_queries('ChatConsumer.connect')
     def get_room(self):
-        """Get room by name or slugified name"""
-        from django.utils.text import slugify
-        try:
-            # Try exact name match first
-            return Room.objects.get(name=self.room_name)
-        except Room.DoesNotExist:
-            try:
-                # Try to find by slugified name
-                rooms = Room.objects.all()
-                return next((r for r in rooms if slugify(r.name) == self.room_name), None)
-            except Exception:
-                return None
+        """Get room by slug or exact name"""
+        # Room URLs carry the slug, so try that first, then the exact name
+        return (
+            Room.objects.filter(slug=self.room_name).first()
+            or Room.objects.filter(name=self.room_name).first()
+        )
 
     @database_sync_to_async
+    @metrics.count_queries('ws_receive')
+    @profile_queries('ChatConsumer.receive')
     def save_message(self, username, message):
         try:
             user = User.objects.get(username=username)
@@ -105,19 +195,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
             
             return message_obj
         except Exception as e:
-            print(f'Error saving message: {e}')
+            logger.warning('Error saving message: %s', e)
             return None
             
     def _get_room_sync(self):
         """Synchronous version of get_room"""
-        from django.utils.text import slugify
-        try:
-            # Try exact name match first
-            return Room.objects.get(name=self.room_name)
-        except Room.DoesNotExist:
-            try:
-                # Try to find by slugified name
-                rooms = Room.objects.all()
-                return next((r for r in rooms if slugify(r.name) == self.room_name), None)
-            except Exception:
-                return None
+        # Room URLs carry the slug, so try that first, then the exact name
+        return (
+            Room.objects.filter(slug=self.room_name).first()
+            or Room.objects.filter(name=self.room_name).first()
+        )
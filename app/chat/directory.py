@@ -0,0 +1,81 @@
+"""
+Room directory for the home page.
+
+Rooms are ranked by Room.activity (kept fresh by tasks.refresh_room_ranking)
+and paged with a keyset cursor on (activity, id), so every page is an index
+range scan no matter how many rooms exist. Rendered pages are cached as a
+template fragment keyed on a directory version, which invalidate() bumps.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.text import slugify
+
+from .models import Room
+from . import presence
+
+VERSION_KEY = 'rooms:directory:version'
+
+
+def version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def invalidate():
+    """Expire every cached directory page"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+class RoomDirectory:
+    """
+    One page of the directory. Nothing touches the database until `rooms` is
+    used, so a cached fragment costs no queries.
+    """
+
+    def __init__(self, query='', after=None, page_size=None):
+        self.prefix = slugify(query or '')
+        self.after = self.parse_cursor(after)
+        self.page_size = page_size or settings.ROOM_DIRECTORY_PAGE_SIZE
+        self.version = version()
+
+    @staticmethod
+    def parse_cursor(cursor):
+        try:
+            activity, room_id = (int(part) for part in cursor.split('.'))
+        except (AttributeError, ValueError):
+            return None
+        return activity, room_id
+
+    @property
+    def cursor(self):
+        return '%d.%d' % self.after if self.after else ''
+
+    @cached_property
+    def page(self):
+        rooms = Room.objects.only('id', 'name', 'slug', 'activity').order_by('-activity', '-id')
+        if self.prefix:
+            rooms = rooms.filter(slug__startswith=self.prefix)
+        if self.after:
+            activity, room_id = self.after
+            rooms = rooms.filter(Q(activity__lt=activity) | Q(activity=activity, id__lt=room_id))
+        # One extra row tells us whether there is a next page
+        return list(rooms[:self.page_size + 1])
+
+    @cached_property
+    def rooms(self):
+        rooms = self.page[:self.page_size]
+        online = presence.online_users_many([room.slug for room in rooms])
+        for room in rooms:
+            room.online = len(online.get(room.slug, []))
+        return rooms
+
+    @cached_property
+    def next_cursor(self):
+        if len(self.page) <= self.page_size:
+            return None
+        last = self.page[self.page_size - 1]
+        return f'{last.activity}.{last.id}'
@@ -0,0 +1,641 @@
+import asyncio
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import quote
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from chat.auth import user_cache_key
+from chat.models import Room, Message
+
+WORDS = (
+    'hello there friends how is everyone doing today this game was great '
+    'lets meet after school homework is hard i love this room awesome bad '
+    'terrible wonderful happy sad angry excited pizza music movie later'
+).split()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3) if samples else None,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3) if samples else None,
+        'p99_ms': round(percentile(samples, 99) * 1000, 3) if samples else None,
+        'max_ms': round(max(samples) * 1000, 3) if samples else None,
+    }
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def http_load(port, path, connections, duration):
+    """
+    Keep-alive GETs from `connections` threads for `duration` seconds.
+    Runs in a separate process so the client isn't limited to one core.
+    """
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], []
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(1)
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # A sample is enough for percentiles and keeps the result small to pickle
+    return len(latencies), len(errors), latencies[::max(1, len(latencies) // 2000)]
+
+
+@contextmanager
+def count_all_queries():
+    """Queries from every thread, including database_sync_to_async's"""
+    count = [0]
+    execute = CursorWrapper._execute
+
+    def counting_execute(self, *args, **kwargs):
+        count[0] += 1
+        return execute(self, *args, **kwargs)
+
+    with mock.patch.object(CursorWrapper, '_execute', counting_execute):
+        yield count
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the chat benchmarks against a throwaway test database and write '
+        'the results as JSON so runs can be compared'
+    )
+
+    scenarios = ('websocket', 'connect', 'moderation', 'statistics', 'admin', 'search', 'serving')
+    # 'serving' starts real server processes and runs for a while; opt in by name
+    default_scenarios = ('websocket', 'connect', 'moderation', 'statistics', 'admin', 'search')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenario', nargs='*', help=f"Scenarios to run: {', '.join(self.scenarios)} (default: all but serving)",
+        )
+        parser.add_argument('--clients', type=int, default=50, help='Simulated WebSocket clients')
+        parser.add_argument('--rooms', type=int, default=5, help='Rooms the clients are spread over')
+        parser.add_argument('--messages', type=int, default=20, help='Messages sent per client')
+        parser.add_argument('--seed-messages', type=int, default=20000, help='Messages in the seeded dataset')
+        parser.add_argument('--seed-rooms', type=int, default=20)
+        parser.add_argument('--seed-users', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=20, help='Iterations for the timed DB scenarios')
+        parser.add_argument(
+            '--layer', choices=('memory', 'redis'), default='memory',
+            help='In-memory channel layer and fakeredis presence, or the configured Redis',
+        )
+        parser.add_argument(
+            '--workers', default='1,2,4', help='Comma separated worker counts for the serving scenario',
+        )
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per worker count')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent HTTP connections')
+        parser.add_argument('--output', help='Write JSON results here instead of stdout')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test database between runs')
+        parser.add_argument('--seed', type=int, default=1234, help='Random seed for the dataset')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        scenarios = options['scenario'] or self.default_scenarios
+        unknown = set(scenarios) - set(self.scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+        stack = ExitStack()
+        old_name = connection.settings_dict['NAME']
+        # database_sync_to_async runs queries on pool threads whose persistent
+        # connections would otherwise outlive the run and block dropping the
+        # test database. The settings dict is shared by every thread's wrapper.
+        connection.settings_dict['CONN_MAX_AGE'] = 0
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            results = {}
+            if options['layer'] == 'memory':
+                stack.enter_context(self.fake_presence())
+            for scenario in scenarios:
+                self.stderr.write(f'Running {scenario}...')
+                results[scenario] = getattr(self, f'bench_{scenario}')()
+            # Before teardown, so a failure there doesn't lose the results
+            self.write_report(results)
+        finally:
+            stack.close()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def write_report(self, results):
+        report = json.dumps({'meta': self.meta(), 'results': results}, indent=2)
+        if self.options['output']:
+            with open(self.options['output'], 'w') as f:
+                f.write(report + '\n')
+            self.stderr.write(f"Wrote {self.options['output']}")
+        else:
+            self.stdout.write(report)
+
+    def meta(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        options = {k: v for k, v in self.options.items() if k in (
+            'clients', 'rooms', 'messages', 'seed_messages', 'seed_rooms',
+            'seed_users', 'repeat', 'layer', 'seed', 'workers', 'duration', 'concurrency',
+        )}
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cpus': available_cpus(),
+            'options': options,
+        }
+
+    # Datasets
+
+    def create_users(self, count, prefix='bench'):
+        User = get_user_model()
+        users = [User(username=f'{prefix}{i}') for i in range(count)]
+        User.objects.bulk_create(users, ignore_conflicts=True)
+        return list(User.objects.filter(username__startswith=prefix).order_by('id')[:count])
+
+    def seed_dataset(self):
+        """Rooms full of messages spread over the last two weeks, once per run"""
+        if getattr(self, 'seeded', None):
+            return self.seeded
+
+        users = self.create_users(self.options['seed_users'], prefix='seed')
+        rooms = [Room.objects.get_or_create(name=f'Seed Room {i}')[0] for i in range(self.options['seed_rooms'])]
+        statuses = ['approved'] * 8 + ['pending', 'flagged']
+        now = timezone.now()
+        batch_size = 1000
+        total = self.options['seed_messages']
+
+        for start in range(0, total, batch_size):
+            batch = []
+            for _ in range(min(batch_size, total - start)):
+                status = self.random.choice(statuses)
+                batch.append(Message(
+                    room=self.random.choice(rooms),
+                    user=self.random.choice(users),
+                    content=' '.join(self.random.choices(WORDS, k=self.random.randint(3, 20))),
+                    moderation_status=status,
+                    is_flagged=status == 'flagged',
+                    moderation_notes={'sentiment': {
+                        'polarity': round(self.random.uniform(-1, 1), 3),
+                        'subjectivity': round(self.random.random(), 3),
+                    }},
+                ))
+            created = Message.objects.bulk_create(batch)
+            # created_at is auto_now_add, so spread the batches out afterwards
+            Message.objects.filter(id__in=[m.id for m in created]).update(
+                created_at=now - timedelta(minutes=self.random.randint(0, 14 * 24 * 60))
+            )
+
+        self.seeded = rooms
+        return rooms
+
+    # Scenarios
+
+    def bench_websocket(self):
+        """N clients over M rooms through the real ASGI application"""
+        from channels.testing import WebsocketCommunicator
+        from chat_project.asgi import application
+
+        clients = self.options['clients']
+        per_client = self.options['messages']
+        users = self.create_users(clients)
+        rooms = [Room.objects.get_or_create(name=f'Bench Room {i}')[0] for i in range(self.options['rooms'])]
+        room_of = {user.id: rooms[i % len(rooms)] for i, user in enumerate(users)}
+
+        # Real session cookies so AuthMiddlewareStack does its usual work
+        cookies = {}
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            cookies[user.id] = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        overrides = {
+            # The limiter would (correctly) throttle a benchmark
+            'CHAT_RATE_LIMITS': {},
+        }
+        if self.options['layer'] == 'memory':
+            overrides['CHANNEL_LAYERS'] = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+        with ExitStack() as stack:
+            stack.enter_context(override_settings(**overrides))
+            # Moderation has its own scenario; keep Celery out of this one
+            stack.enter_context(mock.patch('chat.tasks.moderate_message_content.delay'))
+            result = asyncio.run(self.drive_websockets(
+                application, WebsocketCommunicator, users, room_of, cookies, per_client,
+            ))
+
+        result.update({'clients': clients, 'rooms': len(rooms), 'messages_per_client': per_client})
+        return result
+
+    def fake_presence(self):
+        """In-process Redis stand-in for presence when running without Redis"""
+        import fakeredis
+        from chat import presence
+
+        server = fakeredis.FakeServer()
+        sync_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        stack = ExitStack()
+        stack.enter_context(mock.patch.object(presence, 'get_redis', return_value=sync_client))
+        stack.enter_context(mock.patch.object(
+            presence, 'get_async_redis',
+            side_effect=lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+        ))
+        return stack
+
+    async def drive_websockets(self, application, communicator_class, users, room_of, cookies, per_client):
+        room_sizes = {}
+        for user in users:
+            room_sizes[room_of[user.id].id] = room_sizes.get(room_of[user.id].id, 0) + 1
+
+        async def connect(user):
+            communicator = communicator_class(
+                application,
+                f'/ws/chat/{room_of[user.id].slug}/',
+                headers=[(b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookies[user.id]}'.encode())],
+            )
+            connected, _ = await communicator.connect(timeout=30)
+            assert connected, f'{user.username} could not connect'
+            return communicator
+
+        start = time.perf_counter()
+        communicators = await asyncio.gather(*(connect(user) for user in users))
+        connect_time = time.perf_counter() - start
+
+        latencies = []
+
+        async def listen(user, communicator):
+            # Every client sees every message sent to its room
+            expected = room_sizes[room_of[user.id].id] * per_client
+            seen = 0
+            while seen < expected:
+                event = await communicator.receive_json_from(timeout=60)
+                if event.get('type') != 'message':
+                    continue
+                sent_at = float(event['message'].rsplit(' ', 1)[1])
+                latencies.append(time.perf_counter() - sent_at)
+                seen += 1
+
+        async def talk(user, communicator):
+            for seq in range(per_client):
+                await communicator.send_json_to({
+                    'message': f'bench {seq} {time.perf_counter()}',
+                    'username': user.username,
+                })
+                await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(listen(u, c) for u, c in zip(users, communicators)),
+            *(talk(u, c) for u, c in zip(users, communicators)),
+        )
+        send_time = time.perf_counter() - start
+
+        await asyncio.gather(*(c.disconnect() for c in communicators))
+
+        sent = len(users) * per_client
+        return {
+            'connect_seconds': round(connect_time, 4),
+            'connects_per_second': round(len(users) / connect_time, 2),
+            'messages_sent': sent,
+            'messages_delivered': len(latencies),
+            'send_seconds': round(send_time, 4),
+            'messages_per_second': round(sent / send_time, 2),
+            'deliveries_per_second': round(len(latencies) / send_time, 2),
+            'end_to_end_latency': summarize(latencies),
+        }
+
+    def bench_connect(self):
+        """
+        Reconnect storms: every client connects at once through the full ASGI
+        stack (session, user, room), with cached sessions and users and with
+        plain database ones
+        """
+        from channels.testing import WebsocketCommunicator
+        from chat_project.asgi import application
+
+        clients = self.options['clients']
+        users = self.create_users(clients, prefix='connect')
+        room, _ = Room.objects.get_or_create(name='Connect Room')
+        variants = {
+            'cached': ('django.contrib.sessions.backends.cached_db', 'chat.auth.CachedModelBackend'),
+            'database': ('django.contrib.sessions.backends.db', 'django.contrib.auth.backends.ModelBackend'),
+        }
+        overrides = {'CHAT_RATE_LIMITS': {}}
+        if self.options['layer'] == 'memory':
+            overrides['CHANNEL_LAYERS'] = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+        results = {}
+        for name, (engine, backend) in variants.items():
+            with override_settings(SESSION_ENGINE=engine, **overrides):
+                cookies, cache_keys = {}, []
+                for user in users:
+                    client = Client()
+                    client.force_login(user, backend=backend)
+                    session = client.session
+                    cookies[user.id] = session.session_key
+                    cache_keys += [getattr(session, 'cache_key', None), user_cache_key(user.id)]
+                # Start cold without flushing a cache that may be shared
+                cache.delete_many([key for key in cache_keys if key])
+
+                rounds = []
+                for _ in range(3):
+                    with count_all_queries() as queries:
+                        elapsed = asyncio.run(self.connect_storm(
+                            application, WebsocketCommunicator, users, room, cookies,
+                        ))
+                    rounds.append({
+                        'connects_per_second': round(clients / elapsed, 2),
+                        'queries_per_connect': round(queries[0] / clients, 2),
+                    })
+            results[name] = {'cold': rounds[0], 'warm': rounds[-1]}
+        results['clients'] = clients
+        return results
+
+    async def connect_storm(self, application, communicator_class, users, room, cookies):
+        async def connect(user):
+            communicator = communicator_class(
+                application,
+                f'/ws/chat/{room.slug}/',
+                headers=[(b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookies[user.id]}'.encode())],
+            )
+            connected, _ = await communicator.connect(timeout=30)
+            assert connected, f'{user.username} could not connect'
+            return communicator
+
+        start = time.perf_counter()
+        communicators = await asyncio.gather(*(connect(user) for user in users))
+        elapsed = time.perf_counter() - start
+        await asyncio.gather(*(c.disconnect() for c in communicators))
+        return elapsed
+
+    def bench_moderation(self):
+        """moderate_message_content run inline, without a broker"""
+        from chat.tasks import moderate_message_content
+
+        rooms = self.seed_dataset()
+        count = min(self.options['seed_messages'], self.options['repeat'] * 25)
+        ids = list(Message.objects.filter(room__in=rooms).values_list('id', flat=True)[:count])
+
+        memory_layer = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+        with override_settings(CHANNEL_LAYERS=memory_layer):
+            samples = []
+            start = time.perf_counter()
+            for message_id in ids:
+                t0 = time.perf_counter()
+                moderate_message_content(message_id)
+                samples.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - start
+
+        return {
+            'messages': len(ids),
+            'messages_per_second': round(len(ids) / elapsed, 2) if elapsed else None,
+            'latency': summarize(samples),
+        }
+
+    def bench_statistics(self):
+        """Room.get_statistics on the seeded dataset"""
+        rooms = self.seed_dataset()
+        room = max(rooms, key=lambda r: r.messages.count())
+        with CaptureQueriesContext(connection) as queries:
+            room.get_statistics()
+        samples = timed(room.get_statistics, self.options['repeat'])
+        return {
+            'room_messages': room.messages.count(),
+            'queries': len(queries),
+            'latency': summarize(samples),
+        }
+
+    def bench_admin(self):
+        """Admin changelists for messages and rooms on the seeded dataset"""
+        self.seed_dataset()
+        User = get_user_model()
+        admin = User.objects.filter(username='bench-admin').first() or User.objects.create_superuser(
+            'bench-admin', 'bench-admin@example.com', 'bench-admin',
+        )
+        client = Client()
+        client.force_login(admin)
+
+        results = {}
+        for name, url in (
+            ('message_changelist', '/admin/chat/message/'),
+            ('message_changelist_search', '/admin/chat/message/?q=pizza'),
+            ('room_changelist', '/admin/chat/room/'),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            assert response.status_code == 200, f'{url} returned {response.status_code}'
+            # Read the count now: later requests reset connection.queries_log
+            query_count = len(queries)
+            samples = timed(lambda: client.get(url), self.options['repeat'])
+            results[name] = {'queries': query_count, 'latency': summarize(samples)}
+        return results
+
+    def bench_search(self):
+        """Content search: full-text/trigram (chat.search) against plain icontains"""
+        from chat.search import search_messages
+
+        rooms = self.seed_dataset()
+        if connection.vendor == 'postgresql':
+            # Fresh planner statistics so the GIN indexes are considered
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Message._meta.db_table}')
+
+        # Whole words, a stemmed form, a partial word and a phrase
+        terms = ('pizza', 'wonderful', 'exciting', 'piz', 'homework is hard')
+        repeat = self.options['repeat']
+        results = {}
+        for term in terms:
+            icontains = Message.objects.filter(content__icontains=term)
+            fulltext = search_messages(Message.objects.all(), term)
+            results[term] = {
+                'icontains': {
+                    'matches': icontains.count(),
+                    'first_page': summarize(timed(lambda: list(icontains.order_by('-id')[:50]), repeat)),
+                },
+                'fulltext': {
+                    'matches': fulltext.count(),
+                    'first_page': summarize(timed(lambda: list(fulltext.order_by('-id')[:50]), repeat)),
+                },
+            }
+
+        # The room-scoped API, paging through with its keyset cursor
+        User = get_user_model()
+        client = Client()
+        client.force_login(User.objects.filter(username__startswith='seed').first())
+        url = f'/{rooms[0].slug}/search/'
+        samples, pages, before = [], 0, None
+        while pages < repeat:
+            params = {'q': 'pizza', **({'before': before} if before else {})}
+            start = time.perf_counter()
+            response = client.get(url, params)
+            samples.append(time.perf_counter() - start)
+            assert response.status_code == 200, f'{url} returned {response.status_code}'
+            pages += 1
+            before = response.json()['next']
+            if before is None:
+                break
+        results['room_api'] = {'pages': pages, 'latency': summarize(samples)}
+        return results
+
+    def bench_serving(self):
+        """HTTP throughput of the multi-worker server (gunicorn.conf.py) by worker count"""
+        database_url = self.server_database_url()
+        if database_url is None:
+            return {'skipped': 'needs PostgreSQL: the servers run in separate processes'}
+
+        self.seed_dataset()
+        path = '/'
+        concurrency = self.options['concurrency']
+        processes = max(1, min(available_cpus(), concurrency))
+        results = {'path': path, 'concurrency': concurrency, 'runs': []}
+        for workers in [int(n) for n in self.options['workers'].split(',')]:
+            self.stderr.write(f'  {workers} worker(s)...')
+            port = free_port()
+            server = self.start_server(workers, port, database_url)
+            try:
+                # Warm up every worker (imports, caches, DB connections) first
+                self.drive_http(port, path, processes, concurrency, 1)
+                count, errors, samples, elapsed = self.drive_http(
+                    port, path, processes, concurrency, self.options['duration'],
+                )
+            finally:
+                server.terminate()
+                server.wait(timeout=60)
+            results['runs'].append({
+                'workers': workers,
+                'requests': count,
+                'errors': errors,
+                'requests_per_second': round(count / elapsed, 2),
+                'latency': summarize(samples),
+            })
+
+        baseline = results['runs'][0]['requests_per_second']
+        for run in results['runs']:
+            run['speedup'] = round(run['requests_per_second'] / baseline, 2) if baseline else None
+        return results
+
+    def server_database_url(self):
+        """DATABASE_URL of the benchmark's test database, for the server processes"""
+        if connection.vendor != 'postgresql':
+            return None
+        db = connection.settings_dict
+        auth = quote(db['USER'] or '', safe='')
+        if db['PASSWORD']:
+            auth += ':' + quote(db['PASSWORD'], safe='')
+        host = quote(db['HOST'] or '', safe='')
+        port = f":{db['PORT']}" if db['PORT'] else ''
+        return f"postgres://{auth}@{host}{port}/{db['NAME']}"
+
+    def start_server(self, workers, port, database_url):
+        env = {
+            **os.environ,
+            'DATABASE_URL': database_url,
+            'WEB_CONCURRENCY': str(workers),
+            'PORT': str(port),
+        }
+        env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+        server = subprocess.Popen(
+            ['gunicorn', '-c', 'gunicorn.conf.py', 'chat_project.asgi:application'],
+            cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn exited with status {server.returncode}')
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+                conn.request('GET', '/health/')
+                if conn.getresponse().status == 200:
+                    return server
+            except OSError:
+                pass
+            time.sleep(0.2)
+        server.kill()
+        raise CommandError('gunicorn did not become ready within 60s')
+
+    def drive_http(self, port, path, processes, concurrency, duration):
+        per_process = [concurrency // processes + (i < concurrency % processes) for i in range(processes)]
+        start = time.perf_counter()
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [pool.submit(http_load, port, path, n, duration) for n in per_process]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+        count = sum(r[0] for r in results)
+        errors = sum(r[1] for r in results)
+        samples = [s for r in results for s in r[2]]
+        return count, errors, samples, elapsed
@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that group messages cross process boundaries on the configured '
+        'channel layer and show how room groups are spread over its Redis hosts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=32)
+        parser.add_argument('--timeout', type=float, default=5.0)
+        # Internal: run as the sending half in a separate process
+        parser.add_argument('--send', metavar='TOKEN', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        # Deterministic but varied names so the sender can rebuild the list
+        # and the shard spread looks like real room slugs
+        groups = [
+            f'chat_layer-check-{uuid.uuid5(uuid.NAMESPACE_OID, str(i)).hex[:12]}'
+            for i in range(options['rooms'])
+        ]
+        if options['send']:
+            asyncio.run(self.send_all(groups, options['send']))
+            return
+
+        result = asyncio.run(self.receive_all(groups, options['timeout']))
+        self.stdout.write(json.dumps(result, indent=2))
+        if result['delivered'] != result['rooms']:
+            raise CommandError(f"Only {result['delivered']}/{result['rooms']} groups received the message")
+
+    async def send_all(self, groups, token):
+        layer = get_channel_layer()
+        for group in groups:
+            await layer.group_send(group, {'type': 'layer.check', 'token': token})
+
+    async def receive_all(self, groups, timeout):
+        layer = get_channel_layer()
+        token = uuid.uuid4().hex
+
+        channels = {}
+        for group in groups:
+            channels[group] = await layer.new_channel()
+            await layer.group_add(group, channels[group])
+
+        try:
+            # The sender is a separate interpreter with its own connections,
+            # just like a Celery worker or another Daphne node
+            sender = await asyncio.create_subprocess_exec(
+                sys.executable, '-m', 'django', 'check_channel_layer',
+                '--rooms', str(len(groups)), '--send', token,
+            )
+            if await sender.wait():
+                raise CommandError('Sender process failed')
+
+            delivered = 0
+            for group, channel in channels.items():
+                try:
+                    message = await asyncio.wait_for(layer.receive(channel), timeout)
+                except asyncio.TimeoutError:
+                    continue
+                delivered += message.get('token') == token
+        finally:
+            for group, channel in channels.items():
+                await layer.group_discard(group, channel)
+
+        shards = {}
+        if hasattr(layer, 'consistent_hash'):
+            for group in groups:
+                index = layer.consistent_hash(group)
+                shards[index] = shards.get(index, 0) + 1
+
+        return {
+            'backend': f'{type(layer).__module__}.{type(layer).__name__}',
+            'rooms': len(groups),
+            'delivered': delivered,
+            'groups_per_host': {str(k): v for k, v in sorted(shards.items())},
+        }
@@ -0,0 +1,139 @@
+"""
+Prometheus metrics for the chat hot paths.
+
+Set PROMETHEUS_MULTIPROC_DIR (to an empty, writable directory) before any
+process starts to aggregate samples from several Daphne workers or Celery
+pool processes; without it each process only reports on itself.
+"""
+import ipaddress
+import os
+import time
+from contextlib import contextmanager
+
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess,
+)
+
+# Latency buckets tuned for in-process work (1ms .. 10s)
+FAST_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+# Query count buckets
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+WS_CONNECTS = Counter(
+    'chat_ws_connects_total', 'WebSocket connection attempts', ['outcome'],
+)
+WS_DISCONNECTS = Counter(
+    'chat_ws_disconnects_total', 'WebSocket disconnects',
+)
+WS_THROTTLED = Counter(
+    'chat_ws_throttled_total', 'Chat messages dropped by the rate limiter', ['scope'],
+)
+RECEIVE_TO_BROADCAST = Histogram(
+    'chat_receive_to_broadcast_seconds', 'Time from receiving a chat frame to its room broadcast',
+    buckets=FAST_BUCKETS,
+)
+SAVE_MESSAGE = Histogram(
+    'chat_save_message_seconds', 'Time spent saving a chat message', buckets=FAST_BUCKETS,
+)
+GROUP_SEND = Histogram(
+    'chat_group_send_seconds', 'Channel layer group_send time', ['event'], buckets=FAST_BUCKETS,
+)
+MODERATION_LAG = Histogram(
+    'chat_moderation_lag_seconds', 'Time from message creation to moderation',
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+MODERATION_STAGE = Histogram(
+    'chat_moderation_stage_seconds', 'Time per moderation stage', ['stage'], buckets=FAST_BUCKETS,
+)
+CELERY_TASK = Histogram(
+    'chat_celery_task_seconds', 'Celery task run time', ['task', 'state'],
+    buckets=FAST_BUCKETS + (30, 60),
+)
+DB_QUERIES = Histogram(
+    'chat_db_queries', 'ORM queries per HTTP request or consumer event', ['source'],
+    buckets=QUERY_BUCKETS,
+)
+
+
+class QueryCounter:
+    """connection.execute_wrapper that just counts queries"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries(source):
+    """
+    Record how many queries run inside the block (or decorated function).
+    Database connections are per thread, so use it on the synchronous side
+    of database_sync_to_async.
+    """
+    counter = QueryCounter()
+    try:
+        with connection.execute_wrapper(counter):
+            yield counter
+    finally:
+        DB_QUERIES.labels(source).observe(counter.count)
+
+
+class MetricsMiddleware:
+    """Counts ORM queries for every HTTP request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with count_queries('http'):
+            return self.get_response(request)
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def scrape_allowed(request):
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_IPS
+    )
+
+
+def metrics_view(request):
+    # The web service is public; don't advertise the endpoint to strangers
+    if not scrape_allowed(request):
+        raise Http404
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+# Celery task timing. task_id -> start time, per worker process
+_task_started = {}
+
+
+@task_prerun.connect
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - started)
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.1 on 2026-10-19 13:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+INDEXES = [
+    models.Index(fields=['created_at'], name='chat_message_created_idx'),
+    models.Index(fields=['room', 'created_at'], name='chat_message_room_created_idx'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    # Build without locking out writes on PostgreSQL
+    concurrently = schema_editor.connection.vendor == 'postgresql'
+    for index in INDEXES:
+        if concurrently:
+            schema_editor.add_index(Message, index, concurrently=True)
+        else:
+            schema_editor.add_index(Message, index)
+
+
+def drop_indexes(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    for index in INDEXES:
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index.name}')
+        else:
+            schema_editor.remove_index(Message, index)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction, but keeps the
+    # message table writable while the indexes build
+    atomic = False
+
+    dependencies = [
+        ('chat', '0002_message_is_flagged_message_moderated_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name='message', index=index) for index in INDEXES
+            ],
+        ),
+    ]
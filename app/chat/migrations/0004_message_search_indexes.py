@@ -0,0 +1,57 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models.functions import Upper
+
+FTS_INDEX = 'chat_message_content_fts'
+TRIGRAM_INDEX = 'chat_message_content_trgm'
+
+
+def search_indexes(trigram):
+    indexes = [
+        # Same expression as chat.search.content_vector()
+        GinIndex(SearchVector('content', config='english'), name=FTS_INDEX),
+    ]
+    if trigram:
+        # Django compiles icontains to UPPER(content) LIKE UPPER(...)
+        indexes.append(GinIndex(OpClass(Upper('content'), name='gin_trgm_ops'), name=TRIGRAM_INDEX))
+    return indexes
+
+
+def trigram_available(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def create_indexes(apps, schema_editor):
+    # PostgreSQL only; other databases keep using icontains scans
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    trigram = trigram_available(schema_editor)
+    if trigram:
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    Message = apps.get_model('chat', 'Message')
+    for index in search_indexes(trigram):
+        schema_editor.add_index(Message, index, concurrently=True)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in (FTS_INDEX, TRIGRAM_INDEX):
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction, but keeps the
+    # message table writable while the indexes build
+    atomic = False
+
+    dependencies = [
+        ('chat', '0003_message_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
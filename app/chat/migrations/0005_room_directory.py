@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-19 14:07
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def fill_slugs(apps, schema_editor):
+    Room = apps.get_model('chat', 'Room')
+    rooms = list(Room.objects.only('id', 'name'))
+    for room in rooms:
+        room.slug = slugify(room.name)
+    Room.objects.bulk_update(rooms, ['slug'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='activity',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(fill_slugs, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['-activity', '-id'], name='chat_room_activity_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def merge_duplicate_rooms(apps, schema_editor):
+    """
+    Rooms whose names slugify the same ("General", "general!") share a URL,
+    channel group and presence key, so only the oldest was reachable. Fold
+    the others' messages into it and drop them, and bring every slug in line
+    with its name as Room.save() now does.
+    """
+    Room = apps.get_model('chat', 'Room')
+    Message = apps.get_model('chat', 'Message')
+    keepers = {}
+    duplicates = {}
+    for room in Room.objects.order_by('id').only('id', 'name', 'slug'):
+        room.slug = slugify(room.name)
+        if room.slug in keepers:
+            duplicates[room.id] = keepers[room.slug].id
+        else:
+            keepers[room.slug] = room
+    for room_id, keeper_id in duplicates.items():
+        Message.objects.filter(room_id=room_id).update(room_id=keeper_id)
+    Room.objects.filter(id__in=list(duplicates)).delete()
+    Room.objects.bulk_update(keepers.values(), ['slug'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    # PostgreSQL won't alter chat_room while the merge's deferred foreign key
+    # checks are pending, so the merge commits in its own transaction first
+    atomic = False
+
+    dependencies = [
+        ('chat', '0005_room_directory'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rooms, migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name='room',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=255, unique=True),
+        ),
+    ]
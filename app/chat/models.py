@@ -1,16 +1,42 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 
-from django.db.models import Count, Avg, Q
+from django.db.models import Count, Avg, FloatField
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast
 from django.utils import timezone
+from django.utils.text import slugify
 from datetime import timedelta
 
 class Room(models.Model):
     name = models.CharField(max_length=255)
+    # URL form of the name, kept in step with it by save(); used for room URLs,
+    # channel groups and presence keys, so it must be unique
+    slug = models.SlugField(max_length=255, blank=True, unique=True)
+    # Messages in the last ROOM_RANKING_WINDOW, refreshed by refresh_room_ranking
+    activity = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Room directory order and keyset pagination
+            models.Index(fields=['-activity', '-id'], name='chat_room_activity_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+    def clean(self):
+        slug = slugify(self.name)
+        if not slug:
+            raise ValidationError({'name': 'Room names need at least one letter or digit.'})
+        if Room.objects.filter(slug=slug).exclude(pk=self.pk).exists():
+            raise ValidationError({'name': 'A room with this name already exists.'})
+
+    def save(self, *args, **kwargs):
+        self.slug = slugify(self.name)
+        super().save(*args, **kwargs)
     
     def get_statistics(self):
         """Get room statistics including message counts and sentiment averages"""
@@ -40,12 +66,15 @@ class Room(models.Model):
         ).values('user').distinct().count()
         
         # Average sentiment (excluding messages without sentiment)
-        sentiment_avg = messages.exclude(
-            Q(moderation_notes={}) | 
-            ~Q(moderation_notes__has_key='sentiment')
-        ).annotate(
-            sentiment=Avg('moderation_notes__sentiment__polarity')
-        ).aggregate(avg_sentiment=Avg('sentiment'))['avg_sentiment'] or 0
+        sentiment_avg = messages.filter(
+            moderation_notes__has_key='sentiment'
+        ).aggregate(
+            avg_sentiment=Avg(Cast(KT('moderation_notes__sentiment__polarity'), FloatField()))
+        )['avg_sentiment'] or 0
+        
+        # Users connected right now, from live presence rather than messages
+        from . import presence
+        online_now = presence.online_count(self.slug)
         
         return {
             'total_messages': total_messages,
@@ -55,6 +84,7 @@ class Room(models.Model):
             'pending_count': pending_count,
             'active_users_24h': active_users_24h,
             'active_users_7d': active_users_7d,
+            'online_now': online_now,
             'average_sentiment': round(sentiment_avg * 100, 1)  # as percentage
         }
 
@@ -81,6 +111,12 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Admin changelist ordering and "today" counts
+            models.Index(fields=['created_at'], name='chat_message_created_idx'),
+            # Room history and per-room statistics windows
+            models.Index(fields=['room', 'created_at'], name='chat_message_room_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username}: {self.content[:50]}'
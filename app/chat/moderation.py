@@ -0,0 +1,71 @@
+"""
+Bulk moderation with batched WebSocket notifications.
+
+Admin actions can touch thousands of messages at once. Rather than one
+group_send per message, the affected ids are grouped by room and each room
+group gets a single 'moderation_batch' event (chunked at MODERATION_BATCH_SIZE
+ids so channel layer messages stay small).
+"""
+import logging
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MODERATION_BATCH_SIZE = 1000
+
+
+def moderate(queryset, status, is_flagged):
+    """
+    Set the moderation status of every message in `queryset` and notify the
+    rooms they were posted in. Returns {room slug: [message ids]}.
+
+    Messages are read and updated MODERATION_BATCH_SIZE at a time in id
+    order, so selecting a whole large changelist never builds one huge
+    IN (...) list.
+    """
+    rows = queryset.order_by('id').values_list('id', 'room__slug')
+    by_room = defaultdict(list)
+    moderated_at = timezone.now()
+    last_id = None
+    with transaction.atomic():
+        while True:
+            chunk = rows if last_id is None else rows.filter(id__gt=last_id)
+            chunk = list(chunk[:MODERATION_BATCH_SIZE])
+            if not chunk:
+                break
+            message_ids = [message_id for message_id, _ in chunk]
+            queryset.model.objects.filter(id__in=message_ids).update(
+                moderation_status=status,
+                is_flagged=is_flagged,
+                moderated_at=moderated_at,
+            )
+            for message_id, room in chunk:
+                by_room[room].append(message_id)
+            last_id = message_ids[-1]
+
+        # Only tell clients once the change is committed
+        transaction.on_commit(lambda: broadcast_batches(by_room, status))
+    return by_room
+
+
+def broadcast_batches(by_room, status):
+    channel_layer = get_channel_layer()
+    for room, message_ids in by_room.items():
+        for start in range(0, len(message_ids), MODERATION_BATCH_SIZE):
+            with metrics.GROUP_SEND.labels('moderation_batch').time():
+                async_to_sync(channel_layer.group_send)(
+                    f'chat_{room}',
+                    {
+                        'type': 'moderation_batch',
+                        'status': status,
+                        'message_ids': message_ids[start:start + MODERATION_BATCH_SIZE],
+                    }
+                )
+    logger.info('Sent %s moderation batches to %d rooms', status, len(by_room))
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids exact COUNT(*) on big tables.
+
+    Unfiltered querysets use the planner's row estimate from pg_class once it
+    is above ADMIN_ESTIMATED_COUNT_THRESHOLD. Filtered querysets are counted
+    exactly, but the count stops at the threshold so a broad filter can't
+    turn into a full scan.
+    """
+
+    # Whether `count` is an estimate (or a lower bound) rather than exact
+    estimated = False
+
+    @cached_property
+    def count(self):
+        threshold = settings.ADMIN_ESTIMATED_COUNT_THRESHOLD
+        queryset = self.object_list
+
+        if not queryset.query.where:
+            estimate = self.table_estimate(queryset)
+            if estimate is not None and estimate > threshold:
+                self.estimated = True
+                return estimate
+            return queryset.count()
+
+        count = queryset[:threshold + 1].count()
+        if count > threshold:
+            self.estimated = True
+            return threshold
+        return count
+
+    def table_estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 (or 0) until the table has been analyzed
+        if not row or row[0] <= 0:
+            return None
+        return row[0]
@@ -0,0 +1,132 @@
+"""
+Live room presence kept in Redis.
+
+Each room has a sorted set `presence:<room>` whose members are
+`<username>|<channel_name>` (one per open socket) scored by the time of the
+last heartbeat. Entries older than PRESENCE_TTL are treated as gone and
+pruned lazily, so crashed nodes never leave users online forever.
+"""
+import asyncio
+import logging
+import time
+import weakref
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+ROOMS_KEY = 'presence:rooms'
+
+# Like the cache, give up quickly rather than stall requests when Redis is down
+CLIENT_OPTIONS = {'decode_responses': True, 'socket_connect_timeout': 1, 'socket_timeout': 1}
+
+_client = None
+# redis.asyncio connections belong to the loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.PRESENCE_REDIS_URL, **CLIENT_OPTIONS)
+    return _client
+
+
+def get_async_redis():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = aioredis.Redis.from_url(
+            settings.PRESENCE_REDIS_URL, **CLIENT_OPTIONS
+        )
+    return client
+
+
+@receiver(setting_changed)
+def reset_presence_clients(setting, **kwargs):
+    global _client
+    if setting == 'PRESENCE_REDIS_URL':
+        _client = None
+        _async_clients.clear()
+
+
+def room_key(room):
+    return f'presence:{room}'
+
+
+def _member(username, channel_name):
+    return f'{username}|{channel_name}'
+
+
+def _usernames(members):
+    return sorted({member.split('|', 1)[0] for member in members})
+
+
+async def join(room, username, channel_name):
+    """Mark a socket as present (also used as the heartbeat)"""
+    key = room_key(room)
+    try:
+        async with get_async_redis().pipeline(transaction=False) as pipe:
+            pipe.zadd(key, {_member(username, channel_name): time.time()})
+            pipe.expire(key, settings.PRESENCE_TTL * 2)
+            pipe.sadd(ROOMS_KEY, room)
+            await pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('Presence update failed: %s', e)
+
+
+heartbeat = join
+
+
+async def leave(room, username, channel_name):
+    try:
+        await get_async_redis().zrem(room_key(room), _member(username, channel_name))
+    except redis.RedisError as e:
+        logger.warning('Presence update failed: %s', e)
+
+
+def online_users(room):
+    """Sorted usernames currently connected to `room`"""
+    return online_users_many([room])[room]
+
+
+def online_count(room):
+    return len(online_users(room))
+
+
+def online_users_many(rooms):
+    """
+    Online usernames for several rooms in one round trip.
+    Returns {} entries for every room if Redis is unavailable.
+    """
+    rooms = list(rooms)
+    cutoff = time.time() - settings.PRESENCE_TTL
+    try:
+        with get_redis().pipeline(transaction=False) as pipe:
+            for room in rooms:
+                pipe.zremrangebyscore(room_key(room), '-inf', cutoff)
+                pipe.zrange(room_key(room), 0, -1)
+            results = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('Presence lookup failed: %s', e)
+        return {room: [] for room in rooms}
+    return {room: _usernames(members) for room, members in zip(rooms, results[1::2])}
+
+
+def active_rooms():
+    """Rooms that have had a connection since their presence key last expired"""
+    try:
+        return sorted(get_redis().smembers(ROOMS_KEY))
+    except redis.RedisError as e:
+        logger.warning('Presence lookup failed: %s', e)
+        return []
+
+
+def forget_rooms(rooms):
+    """Drop empty rooms from the index so broadcasts skip them"""
+    if rooms:
+        get_redis().srem(ROOMS_KEY, *rooms)
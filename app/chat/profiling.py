@@ -0,0 +1,166 @@
+"""
+Opt-in SQL profiling for HTTP requests and consumer events.
+
+Enable with SQL_PROFILING=1. Each profiled request or event records its query
+count, total DB time and repeated query shapes (the usual N+1 signature), and
+logs to 'chat.profiling' when any of the SQL_PROFILING_* thresholds is crossed,
+together with the application frames that issued the offending queries.
+A sample of profiles can also be appended to SQL_PROFILING_TRACE_FILE as JSON
+lines for offline analysis.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_trace_lock = threading.Lock()
+
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Normalise a statement so queries differing only by parameters match"""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _LITERALS.sub('?', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def app_frames(limit=3):
+    """The innermost stack frames that belong to this project, not libraries"""
+    base = str(settings.BASE_DIR)
+    frames = [
+        f'{frame.filename[len(base) + 1:]}:{frame.lineno} in {frame.name}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base)
+        and 'site-packages' not in frame.filename
+        and not frame.filename.endswith('profiling.py')
+    ]
+    return frames[-limit:]
+
+
+class QueryProfile:
+    """connection.execute_wrapper recording timing and call sites of each query"""
+
+    def __init__(self, label):
+        self.label = label
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'fingerprint': fingerprint(sql),
+                'ms': (time.perf_counter() - start) * 1000,
+                'stack': app_frames(),
+            })
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(q['ms'] for q in self.queries)
+
+    def duplicates(self):
+        """{fingerprint: times} for every query shape that ran more than once"""
+        counts = Counter(q['fingerprint'] for q in self.queries)
+        return {sql: n for sql, n in counts.most_common() if n > 1}
+
+    def slow_queries(self):
+        return [q for q in self.queries if q['ms'] >= settings.SQL_PROFILING_SLOW_QUERY_MS]
+
+    def report(self):
+        problems = []
+        if self.count > settings.SQL_PROFILING_MAX_QUERIES:
+            problems.append(f'{self.count} queries')
+        if self.total_ms >= settings.SQL_PROFILING_MAX_DB_MS:
+            problems.append(f'{self.total_ms:.1f}ms in the database')
+
+        for q in self.slow_queries():
+            logger.warning(
+                '%s: slow query (%.1fms) from %s: %s',
+                self.label, q['ms'], ' <- '.join(reversed(q['stack'])) or '?', q['sql'],
+            )
+
+        for sql, times in self.duplicates().items():
+            if times <= settings.SQL_PROFILING_MAX_DUPLICATES:
+                continue
+            origin = next(q['stack'] for q in self.queries if q['fingerprint'] == sql)
+            problems.append(f'{times}x from {" <- ".join(reversed(origin)) or "?"}: {sql}')
+
+        if problems:
+            logger.warning(
+                '%s: %d queries, %.1fms DB time\n  %s',
+                self.label, self.count, self.total_ms, '\n  '.join(problems),
+            )
+
+        if settings.SQL_PROFILING_TRACE_FILE and random.random() < settings.SQL_PROFILING_SAMPLE_RATE:
+            self.write_trace()
+
+    def write_trace(self):
+        line = json.dumps({
+            'label': self.label,
+            'time': time.time(),
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'duplicates': {
+                hashlib.sha1(sql.encode()).hexdigest()[:12]: {'sql': sql, 'count': n}
+                for sql, n in self.duplicates().items()
+            },
+            'queries': [
+                {'sql': q['sql'], 'ms': round(q['ms'], 3), 'stack': q['stack']}
+                for q in self.queries
+            ],
+        })
+        with _trace_lock, open(settings.SQL_PROFILING_TRACE_FILE, 'a') as f:
+            f.write(line + '\n')
+
+
+@contextmanager
+def profile_queries(label):
+    """
+    Profile the queries run inside the block (or decorated function) when
+    SQL_PROFILING is on. Like metrics.count_queries it has to run on the
+    synchronous side of database_sync_to_async.
+    """
+    if not settings.SQL_PROFILING:
+        yield None
+        return
+
+    profile = QueryProfile(label)
+    try:
+        with connection.execute_wrapper(profile):
+            yield profile
+    finally:
+        profile.report()
+
+
+class SQLProfilingMiddleware:
+    """Profiles every HTTP request; removed from the stack unless SQL_PROFILING is on"""
+
+    def __init__(self, get_response):
+        if not settings.SQL_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with profile_queries(f'{request.method} {request.path}'):
+            return self.get_response(request)
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+import weakref
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second, holding at most `burst` tokens."""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def retry_after(self, now=None, cost=1):
+        """Seconds until `cost` tokens are available (0 if available now)"""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def consume(self, cost=1):
+        """Take `cost` tokens, returning 0 on success or seconds to wait"""
+        wait = self.retry_after(cost=cost)
+        if not wait:
+            self.tokens -= cost
+        return wait
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class LocalBackend:
+    """In-process buckets. Limits are per node when running several processes."""
+
+    # Full buckets are dropped once the table grows past this size.
+    prune_threshold = 10000
+
+    def __init__(self):
+        self.buckets = {}
+
+    async def check(self, limits):
+        """
+        Atomically consume one token from every (key, rate, burst) in `limits`.
+        Returns (None, 0) when allowed or (key, retry_after) for the first
+        bucket that is empty, in which case no tokens are taken.
+        """
+        now = time.monotonic()
+        buckets = []
+        for key, rate, burst in limits:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(rate, burst)
+            wait = bucket.retry_after(now)
+            if wait:
+                return key, wait
+            buckets.append(bucket)
+
+        for bucket in buckets:
+            bucket.tokens -= 1
+
+        if len(self.buckets) > self.prune_threshold:
+            self.buckets = {
+                k: b for k, b in self.buckets.items() if not b.is_idle(now)
+            }
+        return None, 0.0
+
+
+# KEYS: bucket keys; ARGV: now, then (rate, burst) pairs in KEYS order.
+# Returns {0, 0} when allowed, or {index, retry_after_ms} of the first empty
+# bucket (1-based), consuming nothing in that case.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local state = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        return {i, math.ceil((1 - tokens) / rate * 1000)}
+    end
+    state[i] = {tokens, rate, burst}
+end
+for i, key in ipairs(KEYS) do
+    local tokens, rate, burst = state[i][1], state[i][2], state[i][3]
+    redis.call('HSET', key, 'tokens', tokens - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {0, 0}
+"""
+
+
+class RedisBackend:
+    """
+    Buckets shared by every process through a single Lua script call.
+    If Redis is unreachable messages are let through rather than dropped.
+    """
+
+    key_prefix = 'ratelimit:'
+
+    def __init__(self, url):
+        self.url = url
+        # redis.asyncio connections belong to the loop that opened them
+        self.scripts = weakref.WeakKeyDictionary()
+
+    def get_script(self):
+        loop = asyncio.get_running_loop()
+        script = self.scripts.get(loop)
+        if script is None:
+            import redis.asyncio as redis
+
+            client = redis.Redis.from_url(self.url, socket_connect_timeout=1, socket_timeout=1)
+            script = self.scripts[loop] = client.register_script(TOKEN_BUCKET_SCRIPT)
+        return script
+
+    async def check(self, limits):
+        from redis import RedisError
+
+        keys = [self.key_prefix + key for key, _, _ in limits]
+        args = [time.time()]
+        for _, rate, burst in limits:
+            args.extend([rate, burst])
+        try:
+            index, retry_ms = await self.get_script()(keys=keys, args=args)
+        except RedisError:
+            logger.warning('Rate limit check failed, allowing message', exc_info=True)
+            return None, 0.0
+        if not index:
+            return None, 0.0
+        return limits[index - 1][0], retry_ms / 1000
+
+
+class RateLimiter:
+    """
+    Applies the per-user and per-room limits from CHAT_RATE_LIMITS.
+    Per-connection limits are plain TokenBuckets owned by each consumer.
+    """
+
+    scopes = ('user', 'room')
+
+    def __init__(self, limits, backend):
+        self.limits = limits
+        self.backend = backend
+
+    async def check(self, **identities):
+        """
+        Consume a token for each scope, e.g. check(user='alice', room='lobby').
+        Returns (None, 0) when allowed, otherwise (scope, retry_after).
+        """
+        limits = []
+        for scope in self.scopes:
+            config = self.limits.get(scope)
+            if not config or not config['rate'] or identities.get(scope) is None:
+                continue
+            limits.append((f'{scope}:{identities[scope]}', config['rate'], config['burst']))
+        if not limits:
+            return None, 0.0
+
+        key, retry_after = await self.backend.check(limits)
+        if key is None:
+            return None, 0.0
+        return key.split(':', 1)[0], retry_after
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    """Process-wide limiter built from settings on first use"""
+    global _limiter
+    if _limiter is None:
+        if settings.CHAT_RATE_LIMIT_BACKEND == 'redis':
+            backend = RedisBackend(settings.CHAT_RATE_LIMIT_REDIS_URL)
+        else:
+            backend = LocalBackend()
+        _limiter = RateLimiter(settings.CHAT_RATE_LIMITS, backend)
+    return _limiter
+
+
+@receiver(setting_changed)
+def reset_rate_limiter(setting, **kwargs):
+    global _limiter
+    if setting.startswith('CHAT_RATE_LIMIT'):
+        _limiter = None
+
+
+def connection_bucket():
+    """A fresh per-connection bucket, or None if that limit is disabled"""
+    config = settings.CHAT_RATE_LIMITS.get('connection')
+    if not config or not config['rate']:
+        return None
+    return TokenBucket(config['rate'], config['burst'])
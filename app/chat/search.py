@@ -0,0 +1,63 @@
+"""
+Message content search.
+
+On PostgreSQL content is matched with full-text search against the GIN index
+on to_tsvector(SEARCH_CONFIG, content), and, when the pg_trgm index exists,
+with icontains backed by it so partial words still match (without it, the
+last word is matched as a prefix). Other databases fall back to a plain
+icontains.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchVector, SearchVectorExact
+from django.db import connections
+from django.db.models import Q
+
+SEARCH_CONFIG = 'english'
+# Created by migration 0004 when pg_trgm is available
+TRIGRAM_INDEX = 'chat_message_content_trgm'
+
+# Trigram indexes only help from three characters up
+MIN_TRIGRAM_LENGTH = 3
+
+_WORD = re.compile(r'\w+')
+
+_trigram_available = {}
+
+
+def content_vector():
+    # Must stay identical to the indexed expression (see migration 0004)
+    return SearchVector('content', config=SEARCH_CONFIG)
+
+
+def has_trigram_index(using='default'):
+    if using not in _trigram_available:
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", [TRIGRAM_INDEX])
+            _trigram_available[using] = cursor.fetchone() is not None
+    return _trigram_available[using]
+
+
+def content_match(term, using='default'):
+    """Q matching messages whose content matches `term`"""
+    if connections[using].vendor != 'postgresql':
+        return Q(content__icontains=term)
+
+    match = Q(SearchVectorExact(
+        content_vector(), SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch'),
+    ))
+    if len(term) >= MIN_TRIGRAM_LENGTH and has_trigram_index(using):
+        match |= Q(content__icontains=term)
+    else:
+        # No trigram index: treat the last word as a prefix (to_tsquery 'piz:*'),
+        # which the full-text index can still answer
+        words = _WORD.findall(term)
+        if words:
+            match |= Q(SearchVectorExact(
+                content_vector(), SearchQuery(f'{words[-1]}:*', config=SEARCH_CONFIG, search_type='raw'),
+            ))
+    return match
+
+
+def search_messages(queryset, term):
+    return queryset.filter(content_match(term, using=queryset.db))
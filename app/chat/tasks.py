@@ -1,14 +1,18 @@
 import os
 from celery import shared_task
+from django.conf import settings
+from django.db.models import Count, Q
 from django.utils import timezone
 from textblob import TextBlob
 from better_profanity import profanity
 import nltk
+from celery.utils.log import get_task_logger
 from .models import Room, Message
+from . import directory, metrics, presence
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from django.utils.text import slugify
 
+logger = get_task_logger(__name__)
 
 # Download required NLTK data
 if os.getenv('WORKER') == '1':
@@ -24,19 +28,23 @@ def moderate_message_content(message_id):
     """
     Analyze message content for harmful language or harassment
     """
+    stage = metrics.MODERATION_STAGE
     try:
-        message = Message.objects.get(id=message_id)
+        with stage.labels('load').time():
+            message = Message.objects.select_related('room').get(id=message_id)
         content = message.content
         moderation_notes = {}
 
         # Check for profanity
-        if profanity.contains_profanity(content):
+        with stage.labels('profanity').time():
+            contains_profanity = profanity.contains_profanity(content)
+        if contains_profanity:
             moderation_notes['profanity'] = True
             message.is_flagged = True
 
         # Sentiment analysis using TextBlob
-        blob = TextBlob(content)
-        sentiment = blob.sentiment
+        with stage.labels('sentiment').time():
+            sentiment = TextBlob(content).sentiment
         moderation_notes['sentiment'] = {
             'polarity': sentiment.polarity,  # -1 to 1 (negative to positive)
             'subjectivity': sentiment.subjectivity  # 0 to 1 (objective to subjective)
@@ -57,7 +65,9 @@ def moderate_message_content(message_id):
 
         message.moderation_notes = moderation_notes
         message.moderated_at = timezone.now()
-        message.save()
+        with stage.labels('save').time():
+            message.save()
+        metrics.MODERATION_LAG.observe((message.moderated_at - message.created_at).total_seconds())
 
         response = {
             'message_id': message_id,
@@ -67,18 +77,19 @@ def moderate_message_content(message_id):
         }
 
         channel_layer = get_channel_layer()
-        room_group_name = f"chat_{slugify(message.room.name)}" 
+        room_group_name = f"chat_{message.room.slug}"
 
-        print(f"Sending moderation update to room group: {room_group_name}")
-        async_to_sync(channel_layer.group_send)(
-            room_group_name,
-            {
-                'type': 'moderation_update',
-                'message_id': message_id,
-                'status': message.moderation_status,
-                'notes': moderation_notes,
-            }
-        )
+        logger.info("Sending moderation update to room group: %s", room_group_name)
+        with stage.labels('broadcast').time(), metrics.GROUP_SEND.labels('moderation_update').time():
+            async_to_sync(channel_layer.group_send)(
+                room_group_name,
+                {
+                    'type': 'moderation_update',
+                    'message_id': message_id,
+                    'status': message.moderation_status,
+                    'notes': moderation_notes,
+                }
+            )
 
         return response
 
@@ -105,3 +116,53 @@ def count_room_messages(room_id):
         return f"Room '{room.name}' has {message_count} messages"
     except Room.DoesNotExist:
         return f"Room with id {room_id} not found"
+
+@shared_task
+def broadcast_presence():
+    """
+    Push online counts and member lists to every room with live sockets
+    """
+    rooms = presence.active_rooms()
+    if not rooms:
+        return "No active rooms"
+
+    channel_layer = get_channel_layer()
+    empty = []
+    for room, users in presence.online_users_many(rooms).items():
+        if not users:
+            empty.append(room)
+            continue
+        async_to_sync(channel_layer.group_send)(
+            f"chat_{room}",
+            {
+                'type': 'presence_update',
+                'online': len(users),
+                'users': users,
+            }
+        )
+    presence.forget_rooms(empty)
+    return f"Broadcast presence to {len(rooms) - len(empty)} rooms"
+
+@shared_task
+def refresh_room_ranking():
+    """
+    Recompute each room's activity score for the room directory, writing only
+    the rooms whose score changed
+    """
+    since = timezone.now() - timezone.timedelta(seconds=settings.ROOM_RANKING_WINDOW)
+    counts = dict(
+        Message.objects.filter(created_at__gte=since)
+        .order_by().values('room').annotate(count=Count('id')).values_list('room', 'count')
+    )
+    # Rooms that were active before plus rooms that are active now
+    current = Room.objects.filter(Q(activity__gt=0) | Q(id__in=list(counts))).only('id', 'activity')
+    changed = []
+    for room in current:
+        activity = counts.get(room.id, 0)
+        if room.activity != activity:
+            room.activity = activity
+            changed.append(room)
+    Room.objects.bulk_update(changed, ['activity'], batch_size=500)
+    if changed:
+        directory.invalidate()
+    return f"Updated activity for {len(changed)} rooms"
@@ -1,3 +1,544 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import re_path
+
+from . import directory, metrics, presence, profiling
+from .auth import CachedModelBackend
+from .consumers import ChatConsumer
+from .models import Room, Message
+from .moderation import moderate
+from .paginator import EstimatedCountPaginator
+from .ratelimit import LocalBackend, RedisBackend, TokenBucket, get_rate_limiter
+from .search import search_messages
+from .tasks import refresh_room_ranking
+
+User = get_user_model()
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+}
+
+# Admin pages render static URLs; the manifest storage would need collectstatic
+PLAIN_STATIC_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+application = URLRouter([
+    re_path(r'^ws/chat/(?P<room_name>[^/]+)/$', ChatConsumer.as_asgi()),
+])
+
+
+class FakeRedisMixin:
+    """Point presence at an in-process fakeredis server for each test"""
+
+    def setUp(self):
+        super().setUp()
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+        for name, factory in (
+            ('get_redis', lambda: self.redis),
+            ('get_async_redis', lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)),
+        ):
+            patcher = mock.patch.object(presence, name, side_effect=factory)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TokenBucketTests(TestCase):
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        now = bucket.updated
+        for _ in range(3):
+            self.assertEqual(bucket.retry_after(now), 0)
+            bucket.tokens -= 1
+        self.assertAlmostEqual(bucket.retry_after(now), 1.0)
+        self.assertEqual(bucket.retry_after(now + 1), 0)
+
+    def test_local_backend_is_all_or_nothing(self):
+        backend = LocalBackend()
+        limits = [('user:a', 1, 5), ('room:r', 1, 1)]
+        self.assertEqual(async_to_sync(backend.check)(limits), (None, 0.0))
+        key, retry_after = async_to_sync(backend.check)(limits)
+        self.assertEqual(key, 'room:r')
+        self.assertGreater(retry_after, 0)
+        # The rejected call must not have taken a token from the user bucket
+        self.assertAlmostEqual(backend.buckets['user:a'].tokens, 4, places=2)
+
+    def test_redis_backend_is_all_or_nothing(self):
+        # fakeredis runs the Lua script through lupa
+        server = fakeredis.FakeServer()
+        backend = RedisBackend('redis://fake/0')
+        limits = [('room:r', 0.001, 5), ('user:a', 0.001, 2)]
+        with mock.patch(
+            'redis.asyncio.Redis.from_url',
+            side_effect=lambda *args, **kwargs: fakeredis.FakeAsyncRedis(server=server),
+        ):
+            for _ in range(2):
+                self.assertEqual(async_to_sync(backend.check)(limits), (None, 0.0))
+            key, retry_after = async_to_sync(backend.check)(limits)
+        self.assertEqual(key, 'user:a')
+        self.assertGreater(retry_after, 0)
+        # The rejected call must not have taken a token from the room bucket
+        tokens = fakeredis.FakeRedis(server=server).hget('ratelimit:room:r', 'tokens')
+        self.assertAlmostEqual(float(tokens), 3, places=2)
+
+    def test_redis_backend_fails_open(self):
+        # Nothing listens on port 1; the check must let the message through
+        backend = RedisBackend('redis://127.0.0.1:1/0')
+        with self.assertLogs('chat.ratelimit', 'WARNING'):
+            self.assertEqual(async_to_sync(backend.check)([('user:a', 1, 1)]), (None, 0.0))
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    CHAT_RATE_LIMIT_BACKEND='local',
+    CHAT_RATE_LIMITS={
+        'connection': {'rate': 1, 'burst': 5},
+        'user': {'rate': 1, 'burst': 10},
+        'room': {'rate': 100, 'burst': 100},
+    },
+)
+@mock.patch('chat.tasks.moderate_message_content.delay')
+class ConsumerRateLimitTests(FakeRedisMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('flooder', password='x')
+        Room.objects.create(name='lobby')
+
+    def test_flooding_client_db_writes_stay_bounded(self, delay):
+        async def flood():
+            communicator = WebsocketCommunicator(application, '/ws/chat/lobby/')
+            communicator.scope['user'] = self.user
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            for i in range(200):
+                await communicator.send_json_to({'message': f'spam {i}', 'username': 'flooder'})
+
+            events = []
+            while not await communicator.receive_nothing(timeout=0.2):
+                events.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return events
+
+        events = async_to_sync(flood)()
+
+        # Burst of 5 plus at most a token or two refilled during the test
+        self.assertLessEqual(Message.objects.count(), 7)
+        self.assertEqual(delay.call_count, Message.objects.count())
+        throttled = [e for e in events if e['type'] == 'throttle']
+        self.assertEqual(len(throttled), 200 - Message.objects.count())
+        self.assertEqual(throttled[0]['scope'], 'connection')
+
+    def test_anonymous_sockets_cannot_drain_a_users_bucket(self, delay):
+        buckets = get_rate_limiter().backend.buckets
+        buckets.clear()
+
+        async def impersonate():
+            communicator = WebsocketCommunicator(application, '/ws/chat/lobby/')
+            communicator.scope['user'] = AnonymousUser()
+            communicator.scope['client'] = ['203.0.113.7', 50000]
+            await communicator.connect()
+            for _ in range(3):
+                await communicator.send_json_to({'message': 'hi', 'username': 'flooder'})
+            while not await communicator.receive_nothing(timeout=0.2):
+                await communicator.receive_json_from()
+            await communicator.disconnect()
+
+        async_to_sync(impersonate)()
+        self.assertIn('user:anon:203.0.113.7', buckets)
+        self.assertNotIn('user:flooder', buckets)
+
+
+class PresenceTests(FakeRedisMixin, TestCase):
+    def test_join_leave_and_expiry(self):
+        async_to_sync(presence.join)('lobby', 'alice', 'chan-1')
+        async_to_sync(presence.join)('lobby', 'alice', 'chan-2')
+        async_to_sync(presence.join)('lobby', 'bob', 'chan-3')
+        self.assertEqual(presence.online_users('lobby'), ['alice', 'bob'])
+
+        # One of alice's tabs closing keeps her online
+        async_to_sync(presence.leave)('lobby', 'alice', 'chan-1')
+        self.assertEqual(presence.online_count('lobby'), 2)
+
+        # bob's socket went silent past the TTL
+        self.redis.zadd(presence.room_key('lobby'), {'bob|chan-3': time.time() - 3600})
+        self.assertEqual(presence.online_users('lobby'), ['alice'])
+
+    def test_presence_view_resolves_the_room(self):
+        Room.objects.create(name='Room 0')
+        async_to_sync(presence.join)('room-0', 'alice', 'chan-1')
+        self.client.force_login(User.objects.create_user('reader', password='x'))
+        for url in ('/room-0/presence/', '/Room 0/presence/'):
+            self.assertEqual(self.client.get(url).json(), {'room': 'room-0', 'online': 1, 'users': ['alice']})
+        self.assertEqual(self.client.get('/nowhere/presence/').status_code, 404)
+
+    @override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+    def test_broadcast_presence(self):
+        from .tasks import broadcast_presence
+
+        async_to_sync(presence.join)('lobby', 'alice', 'chan-1')
+        async_to_sync(presence.join)('empty', 'bob', 'chan-2')
+        async_to_sync(presence.leave)('empty', 'bob', 'chan-2')
+
+        with mock.patch('chat.tasks.get_channel_layer') as get_channel_layer:
+            layer = get_channel_layer.return_value
+            layer.group_send = mock.AsyncMock()
+            broadcast_presence()
+
+        layer.group_send.assert_awaited_once_with('chat_lobby', {
+            'type': 'presence_update',
+            'online': 1,
+            'users': ['alice'],
+        })
+        self.assertEqual(presence.active_rooms(), ['lobby'])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ConsumerPresenceTests(FakeRedisMixin, TransactionTestCase):
+    def test_connect_and_disconnect_track_presence(self):
+        user = User.objects.create_user('reader', password='x')
+        Room.objects.create(name='lobby')
+
+        async def visit():
+            communicator = WebsocketCommunicator(application, '/ws/chat/lobby/')
+            communicator.scope['user'] = user
+            await communicator.connect()
+            online = presence.online_users('lobby')
+            await communicator.disconnect()
+            return online
+
+        self.assertEqual(async_to_sync(visit)(), ['reader'])
+        self.assertEqual(presence.online_users('lobby'), [])
+
+
+class MetricsTests(FakeRedisMixin, TestCase):
+    def test_metrics_endpoint_reports_http_query_counts(self):
+        before = metrics.REGISTRY.get_sample_value('chat_db_queries_count', {'source': 'http'}) or 0
+        Room.objects.create(name='lobby')
+        self.client.get('/')
+
+        response = Client().get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'chat_receive_to_broadcast_seconds', response.content)
+        after = metrics.REGISTRY.get_sample_value('chat_db_queries_count', {'source': 'http'})
+        # The index page and the metrics request itself
+        self.assertEqual(after - before, 2)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+    def test_metrics_endpoint_only_answers_allowed_addresses(self):
+        self.assertEqual(Client(REMOTE_ADDR='10.1.2.3').get('/metrics/').status_code, 200)
+        self.assertEqual(Client(REMOTE_ADDR='203.0.113.7').get('/metrics/').status_code, 404)
+        self.assertEqual(Client().get('/metrics/').status_code, 404)
+
+
+@override_settings(
+    SQL_PROFILING=True,
+    SQL_PROFILING_MAX_QUERIES=5,
+    SQL_PROFILING_MAX_DUPLICATES=2,
+    SQL_PROFILING_TRACE_FILE=None,
+)
+class SQLProfilingTests(TestCase):
+    def test_fingerprint_ignores_parameters(self):
+        self.assertEqual(
+            profiling.fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND x = 5'),
+            profiling.fingerprint('SELECT *  FROM t WHERE id IN (%s) AND x = 7'),
+        )
+
+    def test_n_plus_one_is_logged_with_call_site(self):
+        for i in range(4):
+            Room.objects.create(name=f'room {i}')
+
+        with self.assertLogs('chat.profiling', 'WARNING') as logs:
+            with profiling.profile_queries('rooms') as profile:
+                [room.messages.count() for room in Room.objects.all()]
+
+        self.assertEqual(profile.count, 5)
+        self.assertEqual(len(profile.duplicates()), 1)
+        self.assertIn('4x from chat/tests.py', logs.output[0])
+
+
+class QueryBudgetTests(FakeRedisMixin, TestCase):
+    """Hot paths must not grow queries with the amount of data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='x')
+        others = [User.objects.create_user(f'user{i}', password='x') for i in range(5)]
+        for i in range(5):
+            room = Room.objects.create(name=f'room {i}')
+            for user in others:
+                Message.objects.create(room=room, user=user, content='hi', moderation_status='approved')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_index(self):
+        # user (the session is cached at login), one page of rooms
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/').status_code, 200)
+        # The user and the rendered directory are cached now
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/').status_code, 200)
+
+    def test_room(self):
+        # user, room (by slug), messages with their users
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get('/room-0/').status_code, 200)
+        # Links by name still work, after the slug lookup misses (the user
+        # is cached by now)
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get('/Room 0/').status_code, 200)
+
+    @override_settings(STATICFILES_STORAGE=PLAIN_STATIC_STORAGE)
+    def test_room_changelist(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        self.redis.zadd(presence.room_key('room-0'), {'user0|a': time.time(), 'user1|b': time.time()})
+        presence.get_redis.reset_mock()
+        # user, filtered and full counts, page of rooms, their per-row figures
+        with self.assertNumQueries(5):
+            response = self.client.get('/admin/chat/room/')
+        self.assertEqual(presence.get_redis.call_count, 1)
+        online = {room.name: room.online for room in response.context_data['cl'].result_list}
+        self.assertEqual(online['room 0'], ['user0', 'user1'])
+        self.assertEqual(online['room 1'], [])
+        self.assertContains(response, '5 users')
+
+
+class ConsumerQueryBudgetTests(TransactionTestCase):
+    # database_sync_to_async closes connections, which a wrapping
+    # TestCase transaction wouldn't survive
+
+    def test_connect_and_receive(self):
+        User.objects.create_user('reader', password='x')
+        Room.objects.create(name='lobby')
+        consumer = ChatConsumer()
+        consumer.room_name = 'lobby'
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(async_to_sync(consumer.get_room)())
+        # user, room, insert
+        with self.assertNumQueries(3):
+            self.assertIsNotNone(async_to_sync(consumer.save_message)('reader', 'hello'))
+
+
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=10, STATICFILES_STORAGE=PLAIN_STATIC_STORAGE)
+class MessageAdminDashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        room = Room.objects.create(name='lobby')
+        for i in range(15):
+            Message.objects.create(
+                room=room, user=cls.admin, content=f'message {i}',
+                is_flagged=i < 3, moderation_status='flagged' if i < 3 else 'pending',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_filtered_count_stops_at_threshold(self):
+        paginator = EstimatedCountPaginator(Message.objects.filter(moderation_status='pending'), 5)
+        self.assertEqual(paginator.count, 10)
+        self.assertTrue(paginator.estimated)
+
+        paginator = EstimatedCountPaginator(Message.objects.filter(is_flagged=True), 5)
+        self.assertEqual(paginator.count, 3)
+        self.assertFalse(paginator.estimated)
+
+    def test_dashboard_stats_single_query_and_cached(self):
+        response = self.client.get('/admin/chat/message/')
+        self.assertEqual(response.context_data['flagged_count'], 3)
+        self.assertEqual(response.context_data['pending_count'], 12)
+        self.assertEqual(response.context_data['today_count'], 15)
+
+        # Second load (session and user cached): room filter choices, count
+        # (after the table estimate on Postgres), page of results
+        with self.assertNumQueries(4 if connection.vendor == 'postgresql' else 3):
+            self.client.get('/admin/chat/message/?p=1')
+
+
+    @mock.patch('chat.moderation.MODERATION_BATCH_SIZE', 5)
+    def test_moderate_updates_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            by_room = moderate(Message.objects.filter(moderation_status='pending'), 'approved', False)
+        # 12 pending messages: updated 5, 5 and 2 at a time
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(len(by_room['lobby']), 12)
+        self.assertEqual(Message.objects.filter(moderation_status='approved').count(), 12)
+
+    @mock.patch('chat.moderation.MODERATION_BATCH_SIZE', 10)
+    @mock.patch('chat.moderation.get_channel_layer')
+    def test_bulk_action_sends_batches_and_refreshes_stats(self, get_channel_layer):
+        group_send = get_channel_layer.return_value.group_send = mock.AsyncMock()
+        self.client.get('/admin/chat/message/')
+
+        ids = list(Message.objects.values_list('id', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/chat/message/', {
+                'action': 'approve_messages', '_selected_action': ids,
+            })
+
+        self.assertEqual(Message.objects.filter(moderation_status='approved').count(), 15)
+        # 15 messages in one room, 10 ids per event
+        self.assertEqual(group_send.await_count, 2)
+        group, event = group_send.await_args_list[0].args
+        self.assertEqual(group, 'chat_lobby')
+        self.assertEqual(event['type'], 'moderation_batch')
+        self.assertEqual(event['status'], 'approved')
+        sent = sum((call.args[1]['message_ids'] for call in group_send.await_args_list), [])
+        self.assertEqual(sorted(sent), sorted(ids))
+
+        response = self.client.get('/admin/chat/message/')
+        self.assertEqual(response.context_data['flagged_count'], 0)
+        self.assertEqual(response.context_data['pending_count'], 0)
+
+class MessageSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='x')
+        cls.room = Room.objects.create(name='lobby')
+        other = Room.objects.create(name='other')
+        for i in range(5):
+            Message.objects.create(room=cls.room, user=cls.user, content=f'pizza party {i}', moderation_status='approved')
+        Message.objects.create(room=cls.room, user=cls.user, content='loved the pizzas', moderation_status='flagged')
+        Message.objects.create(room=cls.room, user=cls.user, content='homework again', moderation_status='approved')
+        Message.objects.create(room=other, user=cls.user, content='pizza elsewhere', moderation_status='approved')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_search_messages(self):
+        matches = search_messages(Message.objects.all(), 'pizza')
+        self.assertEqual(matches.filter(content__startswith='pizza').count(), 6)
+        self.assertFalse(matches.filter(content='homework again').exists())
+        if connection.vendor == 'postgresql':
+            # Full-text search matches other forms of the word
+            self.assertTrue(matches.filter(content='loved the pizzas').exists())
+
+    def test_room_search_pages_with_keyset(self):
+        response = self.client.get('/lobby/search/', {'q': 'pizza', 'limit': 2})
+        data = response.json()
+        self.assertEqual([r['content'] for r in data['results']], ['pizza party 4', 'pizza party 3'])
+
+        seen = [r['id'] for r in data['results']]
+        while data['next']:
+            data = self.client.get('/lobby/search/', {'q': 'pizza', 'limit': 2, 'before': data['next']}).json()
+            seen += [r['id'] for r in data['results']]
+        # Only this room's visible messages, newest first, no repeats
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_room_search_errors(self):
+        self.assertEqual(self.client.get('/lobby/search/').status_code, 400)
+        self.assertEqual(self.client.get('/lobby/search/', {'q': 'x', 'before': 'y'}).status_code, 400)
+        self.assertEqual(self.client.get('/nowhere/search/', {'q': 'x'}).status_code, 404)
+
+    @override_settings(STATICFILES_STORAGE=PLAIN_STATIC_STORAGE)
+    def test_admin_search(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(admin)
+        for term, expected in (('pizza', 7), ('reader', 8), ('other', 1)):
+            response = self.client.get('/admin/chat/message/', {'q': term})
+            self.assertEqual(response.context_data['cl'].result_count, expected, term)
+
+
+@override_settings(ROOM_DIRECTORY_PAGE_SIZE=2)
+class RoomDirectoryTests(FakeRedisMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='x')
+        for name, messages in (('Quiet', 0), ('Games', 3), ('Gardening', 1), ('Music', 3)):
+            room = Room.objects.create(name=name)
+            for _ in range(messages):
+                Message.objects.create(room=room, user=cls.user, content='hi')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        refresh_room_ranking()
+
+    def names(self, page):
+        return [room.name for room in page.rooms]
+
+    def test_ranked_by_activity_with_keyset_pages(self):
+        page = directory.RoomDirectory()
+        self.assertEqual(self.names(page), ['Music', 'Games'])
+        page = directory.RoomDirectory(after=page.next_cursor)
+        self.assertEqual(self.names(page), ['Gardening', 'Quiet'])
+        self.assertIsNone(page.next_cursor)
+
+    def test_prefix_search(self):
+        self.assertEqual(self.names(directory.RoomDirectory('ga')), ['Games', 'Gardening'])
+        self.assertEqual(self.names(directory.RoomDirectory('Gard')), ['Gardening'])
+
+    def test_ranking_refresh_only_writes_changes(self):
+        Message.objects.create(room=Room.objects.get(name='Quiet'), user=self.user, content='hi')
+        self.assertEqual(refresh_room_ranking(), 'Updated activity for 1 rooms')
+        self.assertEqual(Room.objects.get(name='Quiet').activity, 1)
+        self.assertEqual(refresh_room_ranking(), 'Updated activity for 0 rooms')
+
+    def test_create_room_invalidates_cached_page(self):
+        self.client.force_login(self.user)
+        self.client.get('/', {'q': 'new'})
+        self.client.post('/create/', {'room_name': 'New Room'})
+        self.assertContains(self.client.get('/', {'q': 'new'}), 'New Room')
+
+    def test_create_room_reuses_rooms_with_the_same_slug(self):
+        self.client.force_login(self.user)
+        self.assertRedirects(self.client.post('/create/', {'room_name': 'General'}), '/general/')
+        self.assertRedirects(self.client.post('/create/', {'room_name': 'general!'}), '/general/')
+        self.assertEqual(Room.objects.filter(slug='general').count(), 1)
+        # Nothing to build a URL from
+        self.assertRedirects(self.client.post('/create/', {'room_name': '!!!'}), '/')
+        self.assertFalse(Room.objects.filter(slug='').exists())
+
+    def test_clean_rejects_duplicate_and_empty_slugs(self):
+        for name in ('games!', '???'):
+            with self.assertRaises(ValidationError):
+                Room(name=name).full_clean()
+        Room.objects.get(name='Games').full_clean()
+
+    def test_slug_follows_renames(self):
+        room = Room.objects.get(name='Quiet')
+        room.name = 'Very Quiet'
+        room.save()
+        self.assertEqual(room.slug, 'very-quiet')
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get('/very-quiet/'), "const roomName = 'very-quiet'")
+
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', password='x')
+        self.backend = CachedModelBackend()
+
+    def test_user_cached_until_saved(self):
+        self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk).username, 'reader')
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_deleted_user(self):
+        self.backend.get_user(self.user.pk)
+        user_id = self.user.pk
+        self.user.delete()
+        self.assertIsNone(self.backend.get_user(user_id))
@@ -5,4 +5,6 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('create/', views.create_room, name='create_room'),
     path('<str:room_name>/', views.room, name='room'),
+    path('<str:room_name>/presence/', views.room_presence, name='room_presence'),
+    path('<str:room_name>/search/', views.room_search, name='room_search'),
 ]
@@ -1,48 +1,124 @@
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 from django.utils.text import slugify
 from .models import Room, Message
+from .directory import RoomDirectory
+from .search import search_messages
+from . import directory, presence
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
 
 def index(request):
-    rooms = Room.objects.all()
-    return render(request, 'chat/index.html', {'rooms': rooms})
+    query = request.GET.get('q', '').strip()
+    return render(request, 'chat/index.html', {
+        'directory': RoomDirectory(query, after=request.GET.get('after')),
+        'query': query,
+        'cache_ttl': settings.ROOM_DIRECTORY_CACHE_TTL,
+    })
 
 @login_required
 def create_room(request):
     if request.method == 'POST':
-        room_name = request.POST.get('room_name')
-        if room_name:
-            # Create a URL-friendly version of the room name
-            room_slug = slugify(room_name)
+        room_name = request.POST.get('room_name', '').strip()
+        # Names that differ only in case or punctuation are the same room
+        room_slug = slugify(room_name)
+        if room_slug:
             room, created = Room.objects.get_or_create(
-                name=room_name,
+                slug=room_slug, defaults={'name': room_name},
             )
-            return redirect('room', room_name=room_slug)
+            if created:
+                directory.invalidate()
+            return redirect('room', room_name=room.slug)
     return redirect('index')
 
+def find_room(room_name):
+    # Room URLs carry the slug, which is indexed; fall back to the name for
+    # old links
+    return (
+        Room.objects.filter(slug=room_name).first()
+        or Room.objects.filter(name__iexact=room_name).first()
+    )
+
 @login_required
 def room(request, room_name):
-    # Try to find the room by the slugified name
-    try:
-        room = Room.objects.get(name__iexact=room_name)
-    except Room.DoesNotExist:
-        # If not found, try to find by the slugified version
-        rooms = Room.objects.all()
-        room = next((r for r in rooms if slugify(r.name) == room_name), None)
-        if not room:
-            return redirect('index')
+    room = find_room(room_name)
+    if not room:
+        return redirect('index')
     
     messages = Message.objects.filter(
         room=room
-    ).exclude(
+    ).select_related('user').exclude(
         moderation_status__in=['flagged', 'pending']
     ).order_by('created_at')[:50]
 
     return render(request, 'chat/room.html', {
         'room': room,
-        'messages': messages
+        'messages': messages,
+        'heartbeat_interval': settings.PRESENCE_HEARTBEAT_INTERVAL,
+    })
+
+@login_required
+def room_presence(request, room_name):
+    # Presence is keyed on the slug, whichever way the room was addressed
+    room = find_room(room_name)
+    if not room:
+        return JsonResponse({'error': 'Room not found'}, status=404)
+    users = presence.online_users(room.slug)
+    return JsonResponse({
+        'room': room.slug,
+        'online': len(users),
+        'users': users,
+    })
+
+@login_required
+def room_search(request, room_name):
+    """
+    Search a room's visible messages, newest first. Pages are keyed on message
+    id: pass the returned `next` as `before` to get the following page, which
+    stays an index range scan however deep the client pages.
+    """
+    room = find_room(room_name)
+    if not room:
+        return JsonResponse({'error': 'Room not found'}, status=404)
+
+    term = request.GET.get('q', '').strip()
+    if not term:
+        return JsonResponse({'error': 'Missing search term'}, status=400)
+    try:
+        before = int(request.GET['before']) if 'before' in request.GET else None
+        limit = max(1, min(int(request.GET.get('limit', SEARCH_PAGE_SIZE)), SEARCH_MAX_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid before or limit'}, status=400)
+
+    messages = search_messages(
+        Message.objects.filter(room=room).exclude(moderation_status__in=['flagged', 'pending']),
+        term,
+    )
+    if before is not None:
+        messages = messages.filter(id__lt=before)
+    # One extra row tells us whether there is a next page
+    page = list(messages.select_related('user').order_by('-id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    return JsonResponse({
+        'room': room.name,
+        'query': term,
+        'results': [
+            {
+                'id': message.id,
+                'username': message.user.username,
+                'content': message.content,
+                'created_at': message.created_at.isoformat(),
+            }
+            for message in page
+        ],
+        'next': page[-1].id if has_more else None,
     })
 
 def register(request):
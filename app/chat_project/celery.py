@@ -1,5 +1,7 @@
 import os
+import shutil
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_project.settings')
@@ -13,6 +15,28 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    # Workers aren't reachable through the web /metrics/ endpoint, so they
+    # serve their own when METRICS_PORT is set
+    port = os.environ.get('METRICS_PORT')
+    if not port:
+        return
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        # Drop samples left over from before a restart
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir)
+    from prometheus_client import start_http_server
+    from chat.metrics import get_registry
+    start_http_server(int(port), registry=get_registry())
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
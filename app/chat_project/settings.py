@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'chat.metrics.MetricsMiddleware',
+    'chat.profiling.SQLProfilingMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,26 +86,141 @@ TEMPLATES = [
 WSGI_APPLICATION = 'chat_project.wsgi.application'
 ASGI_APPLICATION = 'chat_project.asgi.application'
 
+# Default Redis for everything that doesn't have its own endpoint below
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+
+# Channel layer
+# CHANNEL_REDIS_HOSTS is a comma-separated list of Redis URLs. channels_redis
+# shards groups across them by consistent hashing on the group name, so all
+# members of a room group always meet on the same host. Use the 'pubsub'
+# backend for broadcast-heavy rooms (no per-channel queues, no persistence).
+CHANNEL_REDIS_HOSTS = [
+    host.strip() for host in os.environ.get('CHANNEL_REDIS_HOSTS', REDIS_URL).split(',') if host.strip()
+]
+CHANNEL_LAYER_BACKENDS = {
+    'core': 'channels_redis.core.RedisChannelLayer',
+    'pubsub': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+}
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': CHANNEL_LAYER_BACKENDS[os.environ.get('CHANNEL_LAYER_BACKEND', 'core')],
         'CONFIG': {
-            'hosts': [(os.environ.get('REDIS_URL', 'redis://redis:6379'))],
+            'hosts': CHANNEL_REDIS_HOSTS,
+        },
+    },
+}
+
+# Cache
+# Shared by sessions, cached users, the room directory and the admin
+# dashboard. 'redis' shares entries between processes and nodes; 'locmem'
+# keeps them per process (development and tests).
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', REDIS_URL)
+CACHE_BACKENDS = {
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+        'KEY_PREFIX': 'chat',
+        'OPTIONS': {
+            'socket_connect_timeout': 1,
+            'socket_timeout': 1,
         },
     },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
 }
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+
+# Sessions and authentication
+# 'cached_db' sessions are read from the cache and only hit the database on
+# a miss; 'cache' skips the database altogether (sessions are lost if the
+# cache is flushed). Users are cached for USER_CACHE_TTL seconds by
+# CachedModelBackend, which replaces ModelBackend (listing both would check a
+# wrong password twice); sessions created before the switch log in again.
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('SESSION_BACKEND', 'cached_db')
+AUTHENTICATION_BACKENDS = [
+    'chat.auth.CachedModelBackend',
+]
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '300'))
 
 # Celery Configuration
-CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
-CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', REDIS_URL)
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', REDIS_URL)
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'broadcast-presence': {
+        'task': 'chat.tasks.broadcast_presence',
+        'schedule': float(os.environ.get('PRESENCE_BROADCAST_INTERVAL', '15')),
+    },
+    'refresh-room-ranking': {
+        'task': 'chat.tasks.refresh_room_ranking',
+        'schedule': float(os.environ.get('ROOM_RANKING_INTERVAL', '60')),
+    },
+}
 
 # Channels specific settings
 ASGI_APPLICATION = 'chat_project.asgi.application'
 
+# Chat rate limiting
+# Token buckets for incoming WebSocket messages: RATE tokens per second are
+# refilled up to BURST. A rate of 0 disables that limit. Per-user and per-room
+# buckets live in-process ('local') or are shared by all nodes ('redis').
+CHAT_RATE_LIMITS = {
+    'connection': {
+        'rate': float(os.environ.get('CHAT_RATE_LIMIT_CONNECTION_RATE', '2')),
+        'burst': int(os.environ.get('CHAT_RATE_LIMIT_CONNECTION_BURST', '10')),
+    },
+    'user': {
+        'rate': float(os.environ.get('CHAT_RATE_LIMIT_USER_RATE', '3')),
+        'burst': int(os.environ.get('CHAT_RATE_LIMIT_USER_BURST', '15')),
+    },
+    'room': {
+        'rate': float(os.environ.get('CHAT_RATE_LIMIT_ROOM_RATE', '50')),
+        'burst': int(os.environ.get('CHAT_RATE_LIMIT_ROOM_BURST', '200')),
+    },
+}
+CHAT_RATE_LIMIT_BACKEND = os.environ.get('CHAT_RATE_LIMIT_BACKEND', 'local')
+CHAT_RATE_LIMIT_REDIS_URL = os.environ.get('CHAT_RATE_LIMIT_REDIS_URL', REDIS_URL)
+
+# Admin moderation dashboard
+# Tables larger than ADMIN_ESTIMATED_COUNT_THRESHOLD rows show estimated
+# counts instead of running COUNT(*); dashboard stats are cached briefly.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.environ.get('ADMIN_ESTIMATED_COUNT_THRESHOLD', '100000'))
+ADMIN_STATS_CACHE_TTL = int(os.environ.get('ADMIN_STATS_CACHE_TTL', '30'))
+
+# SQL profiling (opt-in)
+# Logs requests and consumer events that run too many queries, spend too long
+# in the database or repeat the same query shape, and samples full traces to
+# SQL_PROFILING_TRACE_FILE when it is set.
+SQL_PROFILING = os.environ.get('SQL_PROFILING', '0').lower() in ['true', 't', '1', 'yes']
+SQL_PROFILING_MAX_QUERIES = int(os.environ.get('SQL_PROFILING_MAX_QUERIES', '20'))
+SQL_PROFILING_MAX_DB_MS = float(os.environ.get('SQL_PROFILING_MAX_DB_MS', '200'))
+SQL_PROFILING_MAX_DUPLICATES = int(os.environ.get('SQL_PROFILING_MAX_DUPLICATES', '3'))
+SQL_PROFILING_SLOW_QUERY_MS = float(os.environ.get('SQL_PROFILING_SLOW_QUERY_MS', '100'))
+SQL_PROFILING_TRACE_FILE = os.environ.get('SQL_PROFILING_TRACE_FILE')
+SQL_PROFILING_SAMPLE_RATE = float(os.environ.get('SQL_PROFILING_SAMPLE_RATE', '0.01'))
+
+# Prometheus metrics
+# /metrics/ only answers clients in METRICS_ALLOWED_IPS (addresses or CIDR
+# networks); everyone else gets a 404. Celery workers serve their own
+# metrics on METRICS_PORT instead.
+METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()
+]
+
+# Room presence
+# Sockets send a heartbeat every PRESENCE_HEARTBEAT_INTERVAL seconds and count
+# as offline once nothing has been heard from them for PRESENCE_TTL seconds.
+PRESENCE_REDIS_URL = os.environ.get('PRESENCE_REDIS_URL', REDIS_URL)
+PRESENCE_TTL = int(os.environ.get('PRESENCE_TTL', '60'))
+PRESENCE_HEARTBEAT_INTERVAL = int(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL', '20'))
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -112,8 +229,15 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 
 import dj_database_url
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds and reused by later
+# requests and consumer events (0 closes them after each), with a liveness
+# check before reuse so a restarted database doesn't surface as errors.
 DATABASES = {
-    'default': dj_database_url.config(default=DATABASE_URL)
+    'default': dj_database_url.config(
+        default=DATABASE_URL,
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        conn_health_checks=True,
+    )
 }
 
 
@@ -169,3 +293,12 @@ LOGIN_URL = 'login'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Room directory
+# The home page lists rooms by messages posted in the last ROOM_RANKING_WINDOW
+# seconds (refreshed every ROOM_RANKING_INTERVAL by Celery beat), one page of
+# ROOM_DIRECTORY_PAGE_SIZE at a time; rendered pages are cached for
+# ROOM_DIRECTORY_CACHE_TTL seconds.
+ROOM_RANKING_WINDOW = int(os.environ.get('ROOM_RANKING_WINDOW', str(24 * 60 * 60)))
+ROOM_DIRECTORY_PAGE_SIZE = int(os.environ.get('ROOM_DIRECTORY_PAGE_SIZE', '20'))
+ROOM_DIRECTORY_CACHE_TTL = int(os.environ.get('ROOM_DIRECTORY_CACHE_TTL', '60'))
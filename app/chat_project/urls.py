@@ -19,6 +19,7 @@ from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from django.http import HttpResponse
 from chat import views as chat_views
+from chat.metrics import metrics_view
 
 
 def health_check(request):
@@ -26,9 +27,11 @@ def health_check(request):
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Must come before chat.urls, whose room pattern matches any single segment
+    path('health/', health_check, name='health_check'),
+    path('metrics/', metrics_view, name='metrics'),
     path('', include('chat.urls')),
     path('accounts/login/', auth_views.LoginView.as_view(template_name='chat/login.html'), name='login'),
     path('accounts/logout/', auth_views.LogoutView.as_view(next_page='index'), name='logout'),
     path('accounts/register/', chat_views.register, name='register'),
-    path('health/', health_check, name='health_check'),
 ]
@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for the multi-worker serving mode (SERVER_MODE=workers in
+scripts/start.sh): one master process supervising WEB_CONCURRENCY uvicorn
+workers, each running the full ASGI application on its own core.
+"""
+import os
+
+
+def available_cpus():
+    # Respects CPU affinity/cgroup cpusets, unlike os.cpu_count()
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY') or available_cpus())
+# uvicorn speaks WebSockets through the websockets package
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+# On restart or shutdown each worker stops accepting, closes its WebSockets
+# with 1012 (service restart) so browsers reconnect to a live worker, and
+# gets WEB_GRACEFUL_TIMEOUT seconds to finish in-flight requests and
+# consumer disconnects before it is killed.
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+timeout = int(os.environ.get('WEB_WORKER_TIMEOUT', '60'))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', '5'))
+
+# Recycle workers now and then to bound memory growth; the jitter keeps them
+# from all restarting at once
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-' if os.environ.get('WEB_ACCESS_LOG', '0').lower() in ['true', 't', '1', 'yes'] else None
+errorlog = '-'
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+
+def child_exit(server, worker):
+    # Same as the Celery workers: drop a dead process's live gauges
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,12 +1,55 @@
 #!/bin/bash
+set -e
 
-# Apply database migrations
-echo "Applying migrations..."
-python manage.py migrate
+# Usage: start.sh [serve|migrate]
+#
+# SERVER_MODE picks how the ASGI application is served:
+#   daphne  - a single Daphne process (default; development)
+#   workers - gunicorn supervising WEB_CONCURRENCY uvicorn workers, one per
+#             CPU by default (see gunicorn.conf.py)
+# RUN_MIGRATIONS=0 skips migrations here, for deployments that run
+# "start.sh migrate" once as a separate release step.
 
-# Create superuser if not exists
-python manage.py createsuperauto
+SERVER_MODE=${SERVER_MODE:-daphne}
+RUN_MIGRATIONS=${RUN_MIGRATIONS:-1}
+
+migrate() {
+    # Apply database migrations
+    echo "Applying migrations..."
+    python manage.py migrate --noinput
+
+    # Create superuser if not exists
+    python manage.py createsuperauto
+}
+
+if [ "$1" = "migrate" ]; then
+    migrate
+    exit 0
+fi
+
+# Migrations run once, before any serving process starts
+if [ "$RUN_MIGRATIONS" = "1" ]; then
+    migrate
+fi
+
+# Start with a clean metrics directory when aggregating across processes
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
 
 # Start server
-echo "Starting server..."
-exec daphne -b 0.0.0.0 -p 8000 chat_project.asgi:application
+case "$SERVER_MODE" in
+    workers)
+        echo "Starting gunicorn with ${WEB_CONCURRENCY:-one per CPU} uvicorn workers..."
+        exec gunicorn -c gunicorn.conf.py chat_project.asgi:application
+        ;;
+    daphne)
+        echo "Starting server..."
+        exec daphne -b 0.0.0.0 -p "${PORT:-8000}" chat_project.asgi:application
+        ;;
+    *)
+        echo "Unknown SERVER_MODE: $SERVER_MODE (expected daphne or workers)" >&2
+        exit 1
+        ;;
+esac